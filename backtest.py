@@ -1,36 +1,31 @@
-import ccxt
+from candle_store import CandleStore
+from grid_kernel import simulate_range_grid
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from loguru import logger
+import backtest_analytics
 
 class GridBacktest:
     def __init__(self, exchange_id='binance', symbol='BTC/USDT'):
-        self.exchange = getattr(ccxt, exchange_id)()
+        self.candles = CandleStore(exchange_id)
         self.symbol = symbol
         logger.add("backtest.log")
     
     def fetch_historical_data(self, days=30):
-        """获取历史数据"""
+        """获取历史数据，优先使用本地K线缓存"""
         try:
             end_time = datetime.now()
             start_time = end_time - timedelta(days=days)
             
             # 获取K线数据
-            ohlcv = self.exchange.fetch_ohlcv(
+            df = self.candles.load(
                 self.symbol,
                 timeframe='1h',
-                since=int(start_time.timestamp() * 1000),
-                limit=1000
+                since=int(start_time.timestamp() * 1000)
             )
-            
-            # 转换为DataFrame
-            df = pd.DataFrame(
-                ohlcv,
-                columns=['timestamp', 'open', 'high', 'low', 'close', 'volume']
-            )
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df.set_index('timestamp', inplace=True)
+            if df.empty:
+                return None
             
             return df
             
@@ -38,8 +33,106 @@ class GridBacktest:
             logger.error(f"获取历史数据失败：{str(e)}")
             return None
     
-    def run_backtest(self, upper_price, lower_price, grid_num, investment):
-        """运行回测"""
+    def _simulate_close(self, df, grid_levels, per_grid_investment, investment):
+        """按K线收盘价模拟成交，不计手续费和滑点"""
+        result = simulate_range_grid(df['close'].values, grid_levels, per_grid_investment, investment)
+        
+        trades = []
+        times = df.index
+        for bar, level_index, side, price, quantity in zip(
+            result['bar'].tolist(),
+            result['level'].tolist(),
+            result['side'].tolist(),
+            result['price'].tolist(),
+            result['quantity'].tolist()
+        ):
+            value = quantity * price
+            trades.append({
+                'timestamp': times[bar],
+                'type': 'buy' if side > 0 else 'sell',
+                'price': price,
+                'quantity': quantity,
+                'value': per_grid_investment if side > 0 else value,
+                'fee': 0.0,
+                'level': level_index
+            })
+            if side > 0:
+                logger.info(f"买入：价格={price}, 数量={quantity}")
+            else:
+                logger.info(f"卖出：价格={price}, 数量={quantity}")
+        
+        return trades, result['position'], result['cash']
+    
+    def _simulate_fills(self, df, grid_levels, per_grid_investment, investment, fill_model):
+        """按成交模型的盘中穿越事件模拟成交，计入手续费和滑点"""
+        fills = fill_model.fills(
+            df['open'].values,
+            df['high'].values,
+            df['low'].values,
+            df['close'].values,
+            df['volume'].values,
+            grid_levels,
+            per_grid_investment
+        )
+        
+        trades = []
+        position = 0
+        cash = investment
+        times = df.index
+        
+        # 穿越事件已按时间排序，这里只处理依赖资金和持仓的部分
+        for bar, level_index, side, price, fee_rate in zip(
+            fills['bar'].tolist(),
+            fills['level'].tolist(),
+            fills['side'].tolist(),
+            fills['price'].tolist(),
+            fills['fee_rate'].tolist()
+        ):
+            # 买入信号
+            if side > 0:
+                fee = per_grid_investment * fee_rate
+                if cash < per_grid_investment + fee:
+                    continue
+                quantity = per_grid_investment / price
+                trades.append({
+                    'timestamp': times[bar],
+                    'type': 'buy',
+                    'price': price,
+                    'quantity': quantity,
+                    'value': per_grid_investment,
+                    'fee': fee,
+                    'level': level_index
+                })
+                position += quantity
+                cash -= per_grid_investment + fee
+            
+            # 卖出信号
+            elif position > 0:
+                quantity = min(position, per_grid_investment / price)
+                value = quantity * price
+                fee = value * fee_rate
+                trades.append({
+                    'timestamp': times[bar],
+                    'type': 'sell',
+                    'price': price,
+                    'quantity': quantity,
+                    'value': value,
+                    'fee': fee,
+                    'level': level_index
+                })
+                position -= quantity
+                cash += value - fee
+        
+        return trades, position, cash
+    
+    def run_backtest(self, upper_price, lower_price, grid_num, investment, report_path=None,
+                     fill_model=None):
+        """运行回测
+
+        Args:
+            report_path (str): 报告文件路径前缀，指定时导出JSON和HTML报告
+            fill_model (OHLCFillModel): 成交模型，为None时按收盘价成交且不计手续费和滑点
+        """
         try:
             # 获取历史数据
             df = self.fetch_historical_data()
@@ -51,46 +144,13 @@ class GridBacktest:
             grid_levels = [lower_price + i * grid_interval for i in range(grid_num + 1)]
             per_grid_investment = investment / grid_num
             
-            # 回测结果
-            trades = []
-            position = 0
-            cash = investment
-            initial_price = df.iloc[0]['close']
-            
-            # 遍历历史数据
-            for index, row in df.iterrows():
-                price = row['close']
-                
-                # 检查是否触发网格
-                for level in grid_levels:
-                    # 买入信号
-                    if price <= level and cash >= per_grid_investment:
-                        quantity = per_grid_investment / price
-                        trades.append({
-                            'timestamp': index,
-                            'type': 'buy',
-                            'price': price,
-                            'quantity': quantity,
-                            'value': per_grid_investment
-                        })
-                        position += quantity
-                        cash -= per_grid_investment
-                        logger.info(f"买入：价格={price}, 数量={quantity}")
-                    
-                    # 卖出信号
-                    elif price >= level and position > 0:
-                        quantity = min(position, per_grid_investment / price)
-                        value = quantity * price
-                        trades.append({
-                            'timestamp': index,
-                            'type': 'sell',
-                            'price': price,
-                            'quantity': quantity,
-                            'value': value
-                        })
-                        position -= quantity
-                        cash += value
-                        logger.info(f"卖出：价格={price}, 数量={quantity}")
+            # 模拟成交
+            if fill_model is None:
+                trades, position, cash = self._simulate_close(df, grid_levels, per_grid_investment, investment)
+            else:
+                trades, position, cash = self._simulate_fills(
+                    df, grid_levels, per_grid_investment, investment, fill_model
+                )
             
             # 计算回测结果
             trades_df = pd.DataFrame(trades)
@@ -98,7 +158,17 @@ class GridBacktest:
                 total_profit = sum(trades_df[trades_df['type'] == 'sell']['value']) - \
                               sum(trades_df[trades_df['type'] == 'buy']['value'])
                 total_trades = len(trades_df)
-                win_trades = len(trades_df[trades_df['type'] == 'sell'])
+                
+                # 风险与绩效指标
+                bar_times = df.index.values
+                report = backtest_analytics.analyze(
+                    bar_times,
+                    df['close'].values,
+                    backtest_analytics.trades_to_arrays(trades, bar_times),
+                    investment,
+                    n_levels=len(grid_levels)
+                )
+                win_trades = report['win_trades']
                 
                 # 计算最终持仓价值
                 final_price = df.iloc[-1]['close']
@@ -119,6 +189,15 @@ class GridBacktest:
                 logger.info(f"可用现金：{cash:.2f} USDT")
                 logger.info(f"总资产：{total_value:.2f} USDT")
                 logger.info(f"总收益率：{total_return:.2f}%")
+                logger.info(f"最大回撤：{report['max_drawdown'] * 100:.2f}%")
+                logger.info(f"夏普比率：{report['sharpe']:.2f}")
+                logger.info(f"索提诺比率：{report['sortino']:.2f}")
+                logger.info(f"胜率：{report['win_rate'] * 100:.2f}%")
+                
+                if report_path:
+                    backtest_analytics.to_json(report, f"{report_path}.json")
+                    backtest_analytics.to_html(report, f"{report_path}.html")
+                    logger.info(f"回测报告已导出：{report_path}.json / {report_path}.html")
                 
                 return {
                     'total_profit': total_profit,
@@ -127,7 +206,11 @@ class GridBacktest:
                     'final_position': position,
                     'final_cash': cash,
                     'total_value': total_value,
-                    'total_return': total_return
+                    'total_return': total_return,
+                    'max_drawdown': report['max_drawdown'],
+                    'sharpe': report['sharpe'],
+                    'sortino': report['sortino'],
+                    'report': report
                 }
             
             else:
@@ -0,0 +1,234 @@
+import numpy as np
+import json
+import html
+
+# 单笔成交的数组表示，side为1表示买入，-1表示卖出
+TRADE_FIELDS = ('bar', 'time', 'side', 'price', 'quantity', 'fee', 'level')
+
+def trades_to_arrays(trades, bar_times):
+    """将回测成交列表转换为NumPy数组字典
+
+    Args:
+        trades (list): 回测产生的成交记录（dict），包含timestamp、type、price、quantity，
+            可选fee、level
+        bar_times (np.ndarray): K线时间（datetime64）
+    """
+    times = np.array([t['timestamp'] for t in trades], dtype='datetime64[ns]')
+    arrays = {
+        'time': times,
+        'bar': np.searchsorted(bar_times.astype('datetime64[ns]'), times),
+        'side': np.array([1 if t['type'] == 'buy' else -1 for t in trades], dtype=np.int8),
+        'price': np.array([t['price'] for t in trades], dtype=np.float64),
+        'quantity': np.array([t['quantity'] for t in trades], dtype=np.float64),
+        'fee': np.array([t.get('fee', 0.0) for t in trades], dtype=np.float64),
+        'level': np.array([t.get('level', -1) for t in trades], dtype=np.int64),
+    }
+    return arrays
+
+def periods_per_year(bar_times):
+    """根据K线间隔估算每年的周期数"""
+    if len(bar_times) < 2:
+        return 1.0
+    step = np.median(np.diff(bar_times.astype('datetime64[s]').astype(np.int64)))
+    return 365 * 24 * 3600 / step if step > 0 else 1.0
+
+def equity_curve(close, trades, initial_cash):
+    """按K线计算现金、持仓和权益曲线"""
+    n = len(close)
+    side = trades['side'].astype(np.float64)
+    cash_delta = -side * trades['quantity'] * trades['price'] - trades['fee']
+    position_delta = side * trades['quantity']
+    cash = initial_cash + np.cumsum(np.bincount(trades['bar'], weights=cash_delta, minlength=n)[:n])
+    position = np.cumsum(np.bincount(trades['bar'], weights=position_delta, minlength=n)[:n])
+    return cash, position, cash + position * close
+
+def max_drawdown(equity):
+    """最大回撤（比例）及其持续的K线数"""
+    if len(equity) == 0:
+        return 0.0, 0
+    peak = np.maximum.accumulate(equity)
+    drawdown = equity / peak - 1
+    # 每根K线距离上一个新高的距离
+    is_peak = drawdown == 0
+    last_peak = np.maximum.accumulate(np.where(is_peak, np.arange(len(equity)), 0))
+    return float(-drawdown.min()), int((np.arange(len(equity)) - last_peak).max())
+
+def sharpe_ratio(returns, annualization):
+    std = returns.std()
+    return float(returns.mean() / std * np.sqrt(annualization)) if std > 0 else 0.0
+
+def sortino_ratio(returns, annualization):
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2))
+    return float(returns.mean() / downside * np.sqrt(annualization)) if downside > 0 else 0.0
+
+def match_fifo(trades):
+    """按先进先出将卖出与买入拆分为成交批次
+
+    买入和卖出的累计数量各自把数量轴划分为区间，两组区间的交集即为一个批次：
+    一笔卖出可能平掉多笔买入，一笔买入也可能被多笔卖出分批平掉。
+    返回(卖出索引, 买入索引, 批次数量)。
+    """
+    buys = np.flatnonzero(trades['side'] > 0)
+    sells = np.flatnonzero(trades['side'] < 0)
+    if len(buys) == 0 or len(sells) == 0:
+        return sells[:0], buys[:0], np.zeros(0)
+    bought = np.cumsum(trades['quantity'][buys])
+    sold = np.cumsum(trades['quantity'][sells])
+    matched = min(bought[-1], sold[-1])
+    edges = np.union1d(bought, sold)
+    edges = np.concatenate(([0.0], edges[edges < matched], [matched]))
+    starts, quantity = edges[:-1], np.diff(edges)
+    # 丢弃累计数量浮点误差产生的极小区间
+    valid = quantity > matched * 1e-12
+    starts, quantity = starts[valid], quantity[valid]
+    buy_index = np.minimum(np.searchsorted(bought, starts, side='right'), len(buys) - 1)
+    sell_index = np.minimum(np.searchsorted(sold, starts, side='right'), len(sells) - 1)
+    return sells[sell_index], buys[buy_index], quantity
+
+def grid_level_stats(trades, n_levels):
+    """每个网格档位的买卖成交次数与成交额"""
+    level = trades['level']
+    valid = (level >= 0) & (level < n_levels)
+    level = level[valid]
+    buy = trades['side'][valid] > 0
+    value = trades['price'][valid] * trades['quantity'][valid]
+    return {
+        'buy_fills': np.bincount(level[buy], minlength=n_levels),
+        'sell_fills': np.bincount(level[~buy], minlength=n_levels),
+        'buy_value': np.bincount(level[buy], weights=value[buy], minlength=n_levels),
+        'sell_value': np.bincount(level[~buy], weights=value[~buy], minlength=n_levels),
+    }
+
+def analyze(bar_times, close, trades, initial_cash, n_levels=0):
+    """计算回测的风险与绩效指标
+
+    Args:
+        bar_times (np.ndarray): K线时间（datetime64）
+        close (np.ndarray): K线收盘价
+        trades (dict): trades_to_arrays返回的成交数组
+        initial_cash (float): 初始资金
+        n_levels (int): 网格档位数量，为0时不统计档位成交
+    """
+    close = np.asarray(close, dtype=np.float64)
+    annualization = periods_per_year(bar_times)
+    cash, position, equity = equity_curve(close, trades, initial_cash)
+    returns = np.diff(equity) / equity[:-1] if len(equity) > 1 else np.zeros(0)
+    drawdown, drawdown_bars = max_drawdown(equity)
+
+    traded_value = trades['price'] * trades['quantity']
+    total_fee = float(trades['fee'].sum())
+
+    # 已实现盈亏与持仓时间（先进先出配对），手续费按批次数量占成交数量的比例分摊
+    sells, buys, quantity = match_fifo(trades)
+    lot_pnl = (trades['price'][sells] - trades['price'][buys]) * quantity \
+        - trades['fee'][sells] * quantity / trades['quantity'][sells] \
+        - trades['fee'][buys] * quantity / trades['quantity'][buys]
+    lot_holding = (trades['time'][sells] - trades['time'][buys]).astype('timedelta64[s]').astype(np.float64) / 3600
+    # 按卖出汇总为一次往返交易，持仓时间按批次数量加权
+    round_trips, round_trip = np.unique(sells, return_inverse=True)
+    pnl = np.bincount(round_trip, weights=lot_pnl, minlength=len(round_trips))
+    matched = np.bincount(round_trip, weights=quantity, minlength=len(round_trips))
+    holding = np.bincount(round_trip, weights=lot_holding * quantity, minlength=len(round_trips)) / matched if len(round_trips) else np.zeros(0)
+
+    report = {
+        'start': str(bar_times[0]) if len(bar_times) else None,
+        'end': str(bar_times[-1]) if len(bar_times) else None,
+        'initial_cash': float(initial_cash),
+        'final_equity': float(equity[-1]) if len(equity) else float(initial_cash),
+        'total_return': float(equity[-1] / initial_cash - 1) if len(equity) else 0.0,
+        'max_drawdown': drawdown,
+        'max_drawdown_bars': drawdown_bars,
+        'sharpe': sharpe_ratio(returns, annualization) if len(returns) else 0.0,
+        'sortino': sortino_ratio(returns, annualization) if len(returns) else 0.0,
+        'total_trades': int(len(traded_value)),
+        'turnover': float(traded_value.sum() / equity.mean()) if len(equity) else 0.0,
+        'total_fee': total_fee,
+        'fee_drag': total_fee / initial_cash,
+        'round_trips': int(len(round_trips)),
+        'win_trades': int((pnl > 0).sum()),
+        'win_rate': float((pnl > 0).mean()) if len(pnl) else 0.0,
+        'realized_pnl': float(pnl.sum()),
+        'holding_hours': {
+            'mean': float(holding.mean()) if len(holding) else 0.0,
+            'median': float(np.median(holding)) if len(holding) else 0.0,
+            'p90': float(np.percentile(holding, 90)) if len(holding) else 0.0,
+            'max': float(holding.max()) if len(holding) else 0.0,
+        },
+        'equity': equity,
+        'position': position,
+        'bar_times': bar_times,
+    }
+    if n_levels:
+        report['grid_levels'] = grid_level_stats(trades, n_levels)
+    return report
+
+def summarize(reports):
+    """将多组回测报告汇总为按夏普比率排序的指标数组，用于参数扫描"""
+    keys = ('total_return', 'max_drawdown', 'sharpe', 'sortino', 'turnover', 'fee_drag', 'win_rate')
+    table = {key: np.fromiter((r[key] for r in reports), dtype=np.float64, count=len(reports)) for key in keys}
+    table['rank'] = np.argsort(-table['sharpe'], kind='stable')
+    return table
+
+def _downsample(values, max_points):
+    if len(values) <= max_points:
+        return np.arange(len(values)), values
+    index = np.linspace(0, len(values) - 1, max_points).astype(np.int64)
+    return index, values[index]
+
+def _to_serializable(value):
+    if isinstance(value, np.ndarray):
+        if np.issubdtype(value.dtype, np.datetime64):
+            return value.astype(str).tolist()
+        return value.tolist()
+    if isinstance(value, dict):
+        return {k: _to_serializable(v) for k, v in value.items()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def to_json(report, path, max_points=1000):
+    """导出JSON报告，权益曲线降采样到max_points个点"""
+    data = {k: v for k, v in report.items() if k not in ('equity', 'position', 'bar_times')}
+    index, equity = _downsample(report['equity'], max_points)
+    data['equity_curve'] = {'time': report['bar_times'][index], 'equity': equity}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(_to_serializable(data), f, ensure_ascii=False, separators=(',', ':'))
+
+def to_html(report, path, max_points=1000):
+    """导出HTML报告，包含指标表格和权益曲线（内联SVG）"""
+    _, equity = _downsample(report['equity'], max_points)
+    width, height = 900, 300
+    points = ''
+    if len(equity) > 1:
+        low, high = equity.min(), equity.max()
+        span = high - low or 1.0
+        x = np.linspace(0, width, len(equity))
+        y = height - (equity - low) / span * height
+        points = ' '.join(f"{a:.1f},{b:.1f}" for a, b in zip(x, y))
+
+    rows = []
+    for key, value in report.items():
+        if key in ('equity', 'position', 'bar_times', 'grid_levels'):
+            continue
+        if isinstance(value, dict):
+            value = ', '.join(f"{k}={v:.2f}" for k, v in value.items())
+        elif isinstance(value, float):
+            value = f"{value:.4f}"
+        rows.append(f"<tr><th>{html.escape(key)}</th><td>{html.escape(str(value))}</td></tr>")
+
+    if 'grid_levels' in report:
+        levels = report['grid_levels']
+        rows.append("<tr><th>grid_levels</th><td><table><tr><th>level</th><th>buy</th><th>sell</th></tr>")
+        for i, (buy, sell) in enumerate(zip(levels['buy_fills'], levels['sell_fills'])):
+            rows.append(f"<tr><td>{i}</td><td>{buy}</td><td>{sell}</td></tr>")
+        rows.append("</table></td></tr>")
+
+    content = f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>回测报告</title>
+<style>body{{font-family:sans-serif}}th{{text-align:left;padding-right:1em}}</style></head>
+<body><h1>回测报告</h1>
+<svg width="{width}" height="{height}" style="border:1px solid #ccc">
+<polyline fill="none" stroke="#1f77b4" stroke-width="1" points="{points}"/></svg>
+<table>{''.join(rows)}</table></body></html>"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
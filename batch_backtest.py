@@ -0,0 +1,194 @@
+from candle_store import CandleStore
+from database import Database
+from loguru import logger
+from concurrent.futures import ProcessPoolExecutor
+from grid_kernel import simulate_threshold_grid
+from positions import positions_from_arrays
+import backtest_analytics
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import time
+
+def _drawdown(pnl):
+    """盈亏曲线的最大回撤（USDT）"""
+    if len(pnl) == 0:
+        return 0.0
+    return float((np.maximum.accumulate(np.maximum(pnl, 0)) - pnl).max())
+
+def walk_forward(close, params, window, step, fee_rate):
+    """按滚动窗口分别回测，每个窗口从空仓开始"""
+    windows = []
+    for start in range(0, max(len(close) - window, 0) + 1, step):
+        result = simulate_threshold_grid(close[start:start + window], fee_rate=fee_rate, **params)
+        if len(result['pnl']) == 0:
+            continue
+        windows.append({
+            'start': start,
+            'pnl': float(result['pnl'][-1]),
+            'max_drawdown': _drawdown(result['pnl']),
+            'trades': result['trades']
+        })
+    return windows
+
+def backtest_pair(pair, timeframe, since, window_days, step_days, fee_rate):
+    """回测单个交易对配置（在子进程中运行，K线从本地缓存读取）"""
+    df = CandleStore().load(pair['symbol'], timeframe, since=since, refresh=False)
+    if df.empty:
+        return {'symbol': pair['symbol'], 'error': '没有K线数据'}
+
+    times = df.index.values
+    close = df['close'].values
+    bars_per_day = backtest_analytics.periods_per_year(times) / 365
+    window = max(int(window_days * bars_per_day), 1)
+    step = max(int(step_days * bars_per_day), 1)
+
+    params = {
+        'quantity': pair['quantity'],
+        'price_drop': pair['price_drop'],
+        'price_rise': pair['price_rise'],
+        'long_profit': pair['long_profit'],
+        'short_profit': pair['short_profit'],
+        'percent': pair['percent'],
+        'keep_both_sides': pair['keep_both_sides']
+    }
+    full = simulate_threshold_grid(close, fee_rate=fee_rate, **params)
+    windows = walk_forward(close, params, window, step, fee_rate)
+    window_pnl = np.array([w['pnl'] for w in windows])
+
+    return {
+        'symbol': pair['symbol'],
+        'times': times,
+        'pnl': full['pnl'],
+        'total_pnl': float(full['pnl'][-1]),
+        'max_drawdown': _drawdown(full['pnl']),
+        'trades': full['trades'],
+        'open_positions': positions_from_arrays(pair['symbol'], 'long', full['open_longs'], pair['quantity'])
+        + positions_from_arrays(pair['symbol'], 'short', full['open_shorts'], pair['quantity']),
+        'windows': windows,
+        'profitable_windows': float((window_pnl > 0).mean()) if len(window_pnl) else 0.0,
+        'worst_window_pnl': float(window_pnl.min()) if len(window_pnl) else 0.0
+    }
+
+def aggregate(results, capital):
+    """按时间对齐各交易对的盈亏曲线，计算组合指标"""
+    series = [pd.Series(r['pnl'], index=r['times'], name=r['symbol']) for r in results if 'pnl' in r]
+    if not series:
+        return None
+    pnl = pd.concat(series, axis=1).sort_index().ffill().fillna(0).sum(axis=1)
+    equity = capital + pnl.values
+    returns = np.diff(equity) / equity[:-1]
+    annualization = backtest_analytics.periods_per_year(pnl.index.values)
+    drawdown, drawdown_bars = backtest_analytics.max_drawdown(equity)
+    return {
+        'capital': capital,
+        'total_pnl': float(pnl.values[-1]),
+        'total_return': float(pnl.values[-1] / capital),
+        'max_drawdown': drawdown,
+        'max_drawdown_bars': drawdown_bars,
+        'sharpe': backtest_analytics.sharpe_ratio(returns, annualization) if len(returns) else 0.0,
+        'sortino': backtest_analytics.sortino_ratio(returns, annualization) if len(returns) else 0.0,
+        'trades': int(sum(r['trades'] for r in results if 'trades' in r))
+    }
+
+def run_batch(pairs, days=180, timeframe='1h', window_days=30, step_days=7, capital=10000,
+              fee_rate=0.0004, workers=None):
+    """批量回测trading_pairs中的配置
+
+    先在主进程中补齐K线缓存（受交易所频率限制），再在进程池中并行回测各交易对。
+    配置中可用percent（阈值是否为百分比，默认是）和keep_both_sides（是否始终保持
+    一个多单和一个空单，默认否）选择策略规则，见ETHGridTrading.grid_params。
+    """
+    since = int((time.time() - days * 86400) * 1000)
+    store = CandleStore()
+    for symbol in sorted({pair['symbol'] for pair in pairs}):
+        store.update(symbol, timeframe, since=since)
+
+    # MySQL返回Decimal，转换为float后再传给子进程
+    pairs = [{
+        'symbol': pair['symbol'],
+        'quantity': float(pair['quantity']),
+        'price_drop': float(pair['price_drop']),
+        'price_rise': float(pair['price_rise']),
+        'long_profit': float(pair['long_profit']),
+        'short_profit': float(pair['short_profit']),
+        'percent': pair.get('percent', True),
+        'keep_both_sides': pair.get('keep_both_sides', False)
+    } for pair in pairs]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(backtest_pair, pair, timeframe, since, window_days, step_days, fee_rate)
+            for pair in pairs
+        ]
+        results = [future.result() for future in futures]
+
+    return results, aggregate(results, capital)
+
+def main():
+    parser = argparse.ArgumentParser(description='按trading_pairs表中的配置批量回测')
+    parser.add_argument('--strategy', choices=['pairs', 'eth'], default='pairs',
+                        help='pairs：trading_pairs中的配置（百分比阈值）；eth：ETHGridTrading的点数阈值和多空各保持一单的规则')
+    parser.add_argument('--days', type=int, default=180, help='回测天数')
+    parser.add_argument('--timeframe', default='1h', help='K线周期')
+    parser.add_argument('--window-days', type=float, default=30, help='滚动窗口长度（天）')
+    parser.add_argument('--step-days', type=float, default=7, help='滚动窗口步长（天）')
+    parser.add_argument('--capital', type=float, default=10000, help='组合资金（USDT）')
+    parser.add_argument('--fee', type=float, default=0.0004, help='手续费率')
+    parser.add_argument('--workers', type=int, default=None, help='并行进程数')
+    parser.add_argument('--include-inactive', action='store_true', help='包含未激活的交易对')
+    parser.add_argument('--output', help='结果JSON文件路径')
+    args = parser.parse_args()
+
+    if args.strategy == 'eth':
+        # 延迟导入，只回测pairs时不需要加载交易程序
+        from eth_grid_trading import ETHGridTrading
+        pairs = [ETHGridTrading.grid_params()]
+    else:
+        db = Database()
+        pairs = db.get_all_trading_pairs() if args.include_inactive else db.get_active_trading_pairs()
+    if not pairs:
+        logger.warning("没有可回测的交易对配置")
+        return
+
+    results, portfolio = run_batch(
+        pairs,
+        days=args.days,
+        timeframe=args.timeframe,
+        window_days=args.window_days,
+        step_days=args.step_days,
+        capital=args.capital,
+        fee_rate=args.fee,
+        workers=args.workers
+    )
+
+    logger.info("批量回测结果：")
+    for r in results:
+        if 'error' in r:
+            logger.warning(f"{r['symbol']}：{r['error']}")
+            continue
+        logger.info(
+            f"{r['symbol']}：盈亏={r['total_pnl']:.2f}, 最大回撤={r['max_drawdown']:.2f}, "
+            f"交易次数={r['trades']}, 未平仓={len(r['open_positions'])}, 盈利窗口占比={r['profitable_windows'] * 100:.1f}%, "
+            f"最差窗口盈亏={r['worst_window_pnl']:.2f}"
+        )
+    if portfolio:
+        logger.info(
+            f"组合：盈亏={portfolio['total_pnl']:.2f}, 收益率={portfolio['total_return'] * 100:.2f}%, "
+            f"最大回撤={portfolio['max_drawdown'] * 100:.2f}%, 夏普比率={portfolio['sharpe']:.2f}"
+        )
+
+    if args.output:
+        summary = {
+            'portfolio': portfolio,
+            'pairs': [{
+                **{k: v for k, v in r.items() if k not in ('times', 'pnl', 'open_positions')},
+                'open_positions': [p.to_dict() for p in r.get('open_positions', [])]
+            } for r in results]
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+from exchange_cache import get_exchange
+from loguru import logger
+import numpy as np
+import pandas as pd
+import os
+import time
+
+# K线缓存目录
+CANDLE_CACHE_DIR = os.getenv('CANDLE_CACHE_DIR', '.candle_cache')
+
+# 每次请求的K线数量上限（币安为1000）
+FETCH_LIMIT = 1000
+
+class CandleStore:
+    """K线数据本地缓存
+
+    每个交易对和周期保存为一个.npy文件（timestamp, open, high, low, close, volume），
+    读取时只向交易所请求缓存中缺失的头部和尾部数据。
+    """
+
+    def __init__(self, exchange_id='binance', cache_dir=CANDLE_CACHE_DIR):
+        self.exchange_id = exchange_id
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def exchange(self):
+        return get_exchange(self.exchange_id)
+
+    def _path(self, symbol, timeframe):
+        return os.path.join(self.cache_dir, f"{self.exchange_id}_{symbol.replace('/', '_')}_{timeframe}.npy")
+
+    def _read(self, symbol, timeframe):
+        path = self._path(symbol, timeframe)
+        if os.path.exists(path):
+            return np.load(path)
+        return np.zeros((0, 6))
+
+    def _write(self, symbol, timeframe, candles):
+        path = self._path(symbol, timeframe)
+        tmp_path = f"{path}.tmp.npy"
+        np.save(tmp_path, candles)
+        os.replace(tmp_path, path)
+
+    def _fetch(self, symbol, timeframe, since, until):
+        """分页获取[since, until)区间的K线"""
+        rows = []
+        while since < until:
+            ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=FETCH_LIMIT)
+            ohlcv = [row for row in ohlcv if row[0] < until]
+            if not ohlcv:
+                break
+            rows.extend(ohlcv)
+            since = ohlcv[-1][0] + 1
+            if len(ohlcv) < FETCH_LIMIT:
+                break
+        return np.array(rows, dtype=np.float64).reshape(-1, 6)
+
+    def update(self, symbol, timeframe='1h', since=None, until=None):
+        """补齐缓存中缺失的K线，返回全部缓存数据
+
+        Args:
+            since (int): 起始时间（毫秒）
+            until (int): 结束时间（毫秒），默认为当前时间
+        """
+        until = until or int(time.time() * 1000)
+        candles = self._read(symbol, timeframe)
+        parts = [candles]
+        try:
+            if since is not None and (len(candles) == 0 or since < candles[0, 0]):
+                head_until = int(candles[0, 0]) if len(candles) else until
+                parts.insert(0, self._fetch(symbol, timeframe, since, head_until))
+            if since is None and len(candles) == 0:
+                ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=FETCH_LIMIT)
+                parts.append(np.array(ohlcv, dtype=np.float64).reshape(-1, 6))
+            elif len(candles):
+                # 从最后一根K线开始请求，覆盖保存时尚未收盘的K线
+                parts.append(self._fetch(symbol, timeframe, int(candles[-1, 0]), until))
+        except Exception as e:
+            # 网络异常时使用已缓存的数据
+            logger.error(f"获取{symbol} K线数据失败：{str(e)}")
+
+        merged = np.concatenate(parts)
+        if len(merged) != len(candles):
+            # 按时间去重排序，重复的K线保留最新获取的数据
+            _, index = np.unique(merged[::-1, 0], return_index=True)
+            merged = merged[::-1][index]
+            self._write(symbol, timeframe, merged)
+        return merged
+
+    def load(self, symbol, timeframe='1h', since=None, until=None, refresh=True):
+        """读取K线数据，返回以时间为索引的DataFrame
+
+        Args:
+            refresh (bool): 是否先向交易所补齐缺失的数据
+        """
+        if refresh:
+            candles = self.update(symbol, timeframe, since, until)
+        else:
+            candles = self._read(symbol, timeframe)
+
+        if since is not None:
+            candles = candles[candles[:, 0] >= since]
+        if until is not None:
+            candles = candles[candles[:, 0] < until]
+
+        df = pd.DataFrame(candles, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'].astype(np.int64), unit='ms')
+        df.set_index('timestamp', inplace=True)
+        return df
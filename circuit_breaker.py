@@ -0,0 +1,103 @@
+import random
+import time
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，调用被直接拒绝"""
+
+def _transport_errors():
+    """计入熔断失败的异常类型：网络和交易所可用性错误（延迟导入ccxt）"""
+    import ccxt
+    return (ccxt.NetworkError, ccxt.ExchangeNotAvailable, ccxt.RequestTimeout,
+            ccxt.DDoSProtection, ccxt.RateLimitExceeded)
+
+class CircuitBreaker:
+    """交易所接口熔断器
+
+    连续失败达到failure_threshold次后打开，在退避时间内直接拒绝调用；
+    退避时间按指数增长（base_delay * 2^n，不超过max_delay）并加入随机抖动，
+    避免多个交易对同时重试。退避结束后进入半开状态，只放行一次探测调用，
+    成功则关闭，失败则以更长的退避时间重新打开。
+
+    只有网络和交易所可用性错误计为失败；余额不足、订单参数错误等业务拒绝
+    说明接口本身可用，原样抛出且不改变熔断状态。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=3, base_delay=1.0, max_delay=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opens = 0  # 连续打开次数，决定退避时间
+        self.retry_at = 0.0
+
+    def available(self):
+        """是否可以发起调用（不改变状态）"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return self.clock() >= self.retry_at
+        return False
+
+    def allow(self):
+        """申请一次调用，打开状态的退避结束后转为半开并放行一次探测"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and self.clock() >= self.retry_at:
+            self.state = self.HALF_OPEN
+            return True
+        return False
+
+    def retry_after(self):
+        """距离下次允许调用的秒数"""
+        if self.state == self.OPEN:
+            return max(self.retry_at - self.clock(), 0.0)
+        return 0.0
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opens = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            delay = min(self.base_delay * 2 ** self.opens, self.max_delay)
+            # 等比抖动：在[delay/2, delay]之间随机
+            self.retry_at = self.clock() + delay * random.uniform(0.5, 1.0)
+            self.state = self.OPEN
+            self.opens += 1
+
+    def call(self, func, *args, **kwargs):
+        """通过熔断器调用func，打开状态时抛出CircuitOpenError"""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name}已熔断，{self.retry_after():.1f}秒后重试")
+        try:
+            result = func(*args, **kwargs)
+        except _transport_errors():
+            self.record_failure()
+            raise
+        except Exception:
+            if self.state == self.HALF_OPEN:
+                # 探测调用被业务拒绝，恢复为打开状态，下次调用继续探测
+                self.state = self.OPEN
+            raise
+        self.record_success()
+        return result
+
+# 进程内按接口名称共享的熔断器
+_breakers = {}
+
+def get_breaker(name, **kwargs):
+    """获取指定接口的熔断器，例如'ETH/USDT:ticker'"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = CircuitBreaker(name, **kwargs)
+        _breakers[name] = breaker
+    return breaker
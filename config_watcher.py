@@ -0,0 +1,48 @@
+import time
+
+class TradingPairWatcher:
+    """轮询trading_pairs表的变更，供运行中的交易实例热加载配置
+
+    每个轮询周期只执行一次聚合查询（行数、最大updated_at、updated_at之和），
+    版本发生变化时才按updated_at游标拉取变更的行。
+
+    updated_at只有秒级精度，同一秒内的第二次更新可能不改变版本信息。因此只要上次
+    拉取发生在游标所在的那一秒之内（拉取时的数据库时间不晚于游标），就再拉取一次，
+    直到某次拉取发生在更晚的秒，与两次轮询的间隔无关。
+    """
+
+    def __init__(self, db, interval=1):
+        self.db = db
+        self.interval = interval  # 轮询间隔（秒）
+        self.version = None  # 上次看到的版本信息
+        self.cursor = None  # 已应用的最大updated_at
+        self.fetched_at = None  # 上次拉取变更时的数据库时间
+        self.last_poll = 0
+
+    def _version_key(self, row):
+        return (row['total'], row['version'], row['checksum'])
+
+    def poll(self):
+        """返回自上次轮询以来变更的交易对配置，未到轮询时间或无变更时返回空列表"""
+        now = time.time()
+        if now - self.last_poll < self.interval:
+            return []
+        self.last_poll = now
+
+        row = self.db.get_trading_pairs_version()
+        key = self._version_key(row)
+        # 上次拉取之后，游标所在的秒内可能还有更新
+        refetch = (
+            self.cursor is not None
+            and self.fetched_at is not None
+            and self.fetched_at <= self.cursor
+        )
+        if key == self.version and not refetch:
+            return []
+
+        changed = self.db.get_trading_pairs_changed_since(self.cursor)
+        self.version = key
+        self.fetched_at = row['db_time']
+        if changed:
+            self.cursor = max(pair['updated_at'] for pair in changed)
+        return changed
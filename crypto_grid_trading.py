@@ -1,13 +1,23 @@
 from grid_trading import GridTrading
 from database import Database
+from config_watcher import TradingPairWatcher
+from order_book import start_binance_depth_stream
+from exchange_adapter import LiveExchange, ReplayFinished
+from risk_engine import get_risk_engine
+from timeseries_store import get_timeseries_store
+from trading_mode import namespaced
 from loguru import logger
+from profiler import profiler, setup_profiler
 import time
 import os
 
 class CryptoGridTrading(GridTrading):
     def __init__(self, symbol, api_key, api_secret, quantity, db):
-        super().__init__(symbol, api_key, api_secret, quantity)
+        super().__init__(symbol, api_key, api_secret, quantity,
+                         state_dir=namespaced(os.getenv('GRID_STATE_DIR', 'grid_state'), os.sep))
         self.db = db
+        self.metrics = get_timeseries_store(db, source='crypto_spot')
+        self.active = True
         self.setup_logger()
         self.set_thresholds()
 
@@ -38,11 +48,96 @@ class CryptoGridTrading(GridTrading):
         logger.info(f"多单获利平仓阈值：{self.long_profit}")
         logger.info(f"空单获利平仓阈值：{self.short_profit}")
 
+    def apply_config(self, pair):
+        """热加载trading_pairs中的配置，保留内存中的grid_orders和last_price
+
+        Args:
+            pair (dict): trading_pairs表中的一行
+        """
+        thresholds = (
+            float(pair['price_drop']),
+            float(pair['price_rise']),
+            float(pair['long_profit']),
+            float(pair['short_profit'])
+        )
+        if thresholds != (self.price_drop, self.price_rise, self.long_profit, self.short_profit):
+            self.set_thresholds(*thresholds)
+
+        quantity = float(pair['quantity'])
+        if quantity != self.quantity:
+            logger.info(f"{self.symbol}交易数量更新：{self.quantity} -> {quantity}")
+            self.quantity = quantity
+
+        active = pair['status'] == 1
+        if active != self.active:
+            logger.info(f"{self.symbol}{'恢复运行' if active else '暂停运行'}")
+            self.active = active
+
+def create_trader(pair, api_key, api_secret, db):
+    """根据trading_pairs中的一行创建交易实例"""
+    trader = CryptoGridTrading(
+        symbol=pair['symbol'],
+        api_key=api_key,
+        api_secret=api_secret,
+        quantity=float(pair['quantity']),
+        db=db
+    )
+    # 设置交易阈值
+    trader.apply_config(pair)
+    # 订阅差量深度流，用本地订单簿代替ticker
+    if os.getenv('ORDER_BOOK_STREAM', '0') == '1' and isinstance(trader.exchange, LiveExchange):
+        book, stream = start_binance_depth_stream(trader.exchange, trader.symbol)
+        trader.attach_order_book(book, stream)
+    return trader
+
+def apply_config_changes(traders, changed_pairs, api_key, api_secret, db):
+    """将变更的配置应用到运行中的交易实例，新激活的交易对创建新实例"""
+    for pair in changed_pairs:
+        trader = traders.get(pair['symbol'])
+        try:
+            if trader is not None:
+                trader.apply_config(pair)
+            elif pair['status'] == 1:
+                traders[pair['symbol']] = create_trader(pair, api_key, api_secret, db)
+                logger.info(f"新增交易对{pair['symbol']}")
+        except Exception as e:
+            logger.error(f"交易对{pair['symbol']}配置更新失败：{str(e)}")
+
+def poll_config_changes(watcher, traders, api_key, api_secret, db):
+    """轮询并应用配置变更，未到轮询间隔时不访问数据库"""
+    try:
+        with profiler.phase('db'):
+            changed_pairs = watcher.poll()
+        if changed_pairs:
+            apply_config_changes(traders, changed_pairs, api_key, api_secret, db)
+    except Exception as e:
+        logger.error(f"轮询交易对配置失败：{str(e)}")
+
+def record_equity(exchange, traders, metrics, risk):
+    """记录现货账户权益，并更新风险引擎的保证金比例基准
+
+    权益为USDT余额加上各USDT交易对基础币余额按标记价格折算的价值，
+    没有运行交易实例（没有标记价格）的币种不计入。
+    """
+    try:
+        totals = exchange.fetch_balance()['total']
+        equity = totals.get('USDT') or 0
+        for trader in traders.values():
+            base, quote = trader.symbol.split('/')
+            if quote == 'USDT' and trader.mark_price is not None:
+                equity += (totals.get(base) or 0) * trader.mark_price
+        risk.update_equity(equity)
+        metrics.record_source('equity', equity, exchange.milliseconds() / 1000)
+    except Exception as e:
+        logger.error(f"查询账户余额失败：{str(e)}")
+
 def main():
     # 从环境变量获取API密钥
     api_key = os.getenv('BINANCE_API_KEY')
     api_secret = os.getenv('BINANCE_API_SECRET')
 
+    setup_profiler()
+
     # 初始化数据库
     db = Database()
     db.init_database()
@@ -76,32 +171,49 @@ def main():
         trading_pairs = db.get_active_trading_pairs()
 
     # 创建交易实例
-    traders = []
+    traders = {}
     for pair in trading_pairs:
-        trader = CryptoGridTrading(
-            symbol=pair['symbol'],
-            api_key=api_key,
-            api_secret=api_secret,
-            quantity=pair['quantity'],
-            db=db
-        )
-        # 设置交易阈值
-        trader.set_thresholds(
-            price_drop=pair['price_drop'],
-            price_rise=pair['price_rise'],
-            long_profit=pair['long_profit'],
-            short_profit=pair['short_profit']
-        )
-        traders.append(trader)
+        traders[pair['symbol']] = create_trader(pair, api_key, api_secret, db)
+
+    # 配置变更监听，首次轮询会重新下发全部配置（对已有实例无影响）
+    watcher = TradingPairWatcher(db, interval=1)
+
+    # 主循环间隔（秒），模拟和回放模式可以设为0全速运行
+    loop_interval = float(os.getenv('LOOP_INTERVAL', 1))
+
+    # 组合指标：敞口每轮记录，权益每5分钟（交易所时间）查询一次余额
+    metrics = get_timeseries_store(db, source='crypto_spot')
+    risk = get_risk_engine()
+    last_equity_check = 0
 
     # 运行交易
     while True:
-        for trader in traders:
+        poll_config_changes(watcher, traders, api_key, api_secret, db)
+
+        # 交易对较多时一轮耗时可能超过轮询间隔，每个交易对运行后都检查一次配置变更
+        for trader in list(traders.values()):
+            # 暂停或熔断中的交易对直接跳过，不占用本轮时间
+            if not trader.active or not trader.available():
+                continue
             try:
                 trader.run()
+            except ReplayFinished as e:
+                logger.info(f"回放结束：{str(e)}")
+                metrics.flush()
+                return
             except Exception as e:
                 logger.error(f"交易对{trader.symbol}运行出错：{str(e)}")
-        time.sleep(1)  # 休眠1秒
+            poll_config_changes(watcher, traders, api_key, api_secret, db)
+
+        if traders:
+            exchange = next(iter(traders.values())).exchange
+            now = exchange.milliseconds() / 1000
+            metrics.record_source('exposure', risk.total_notional, now)
+            if now - last_equity_check >= 300:
+                last_equity_check = now
+                record_equity(exchange, traders, metrics, risk)
+        with profiler.phase('sleep'):
+            time.sleep(loop_interval)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,5 +1,7 @@
 import pymysql
 from loguru import logger
+from positions import Position
+from trading_mode import get_exchange_mode, namespaced
 import os
 from datetime import datetime
 
@@ -8,12 +10,18 @@ class Database:
         self.host = os.getenv('DB_HOST', 'localhost')
         self.user = os.getenv('DB_USER', 'root')
         self.password = os.getenv('DB_PASSWORD', '')
-        self.db = os.getenv('DB_NAME', 'grid_trading')
+        # 模拟和回放模式使用独立的数据库（如grid_trading_sim），首次运行时自动建库建表
+        self.simulated = get_exchange_mode() != 'live'
+        self.db = namespaced(os.getenv('DB_NAME', 'grid_trading'))
         self.connection = None
         self.connect()
+        if self.simulated:
+            self.init_database()
 
     def connect(self):
         try:
+            if self.simulated:
+                self.create_database()
             self.connection = pymysql.connect(
                 host=self.host,
                 user=self.user,
@@ -26,6 +34,25 @@ class Database:
             logger.error(f"数据库连接失败：{str(e)}")
             raise
 
+    def create_database(self):
+        """数据库不存在时创建"""
+        connection = pymysql.connect(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            charset='utf8mb4'
+        )
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{self.db}` CHARACTER SET utf8mb4")
+            connection.commit()
+        finally:
+            connection.close()
+
+    def refresh_snapshot(self):
+        """结束当前读事务，长连接轮询时避免REPEATABLE READ快照读到旧数据"""
+        self.connection.commit()
+
     def init_database(self):
         try:
             with self.connection.cursor() as cursor:
@@ -70,16 +97,52 @@ class Database:
                     short_profit DECIMAL(10,2) NOT NULL DEFAULT 50,
                     status TINYINT NOT NULL DEFAULT 1,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    INDEX idx_updated_at (updated_at)
                 )
                 """)
 
+                # 已有的trading_pairs表补建updated_at索引（变更轮询按该字段查询）
+                cursor.execute("""
+                SELECT COUNT(*) AS total FROM information_schema.statistics
+                WHERE table_schema = DATABASE() AND table_name = 'trading_pairs' AND index_name = 'idx_updated_at'
+                """)
+                if not cursor.fetchone()['total']:
+                    cursor.execute("CREATE INDEX idx_updated_at ON trading_pairs (updated_at)")
+
                 self.connection.commit()
-                logger.info("数据库初始化成功")
+            self.ensure_metric_rollups()
+            logger.info("数据库初始化成功")
         except Exception as e:
             logger.error(f"数据库初始化失败：{str(e)}")
             raise
 
+    def ensure_metric_rollups(self):
+        """创建metric_rollups表（权益、价格、敞口、盈亏的1m/1h/1d汇总）
+
+        指标写入方和看板启动时调用，不依赖init_database。
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                CREATE TABLE IF NOT EXISTS metric_rollups (
+                    series VARCHAR(64) NOT NULL,
+                    resolution VARCHAR(4) NOT NULL,
+                    bucket DATETIME NOT NULL,
+                    open DOUBLE NOT NULL,
+                    high DOUBLE NOT NULL,
+                    low DOUBLE NOT NULL,
+                    close DOUBLE NOT NULL,
+                    total DOUBLE NOT NULL,
+                    samples INT NOT NULL,
+                    PRIMARY KEY (series, resolution, bucket)
+                )
+                """)
+                self.connection.commit()
+        except Exception as e:
+            logger.error(f"创建指标汇总表失败：{str(e)}")
+            raise
+
     def record_position(self, symbol, position_type, quantity, entry_price, current_price, profit_loss, status):
         try:
             with self.connection.cursor() as cursor:
@@ -90,6 +153,58 @@ class Database:
             logger.error(f"记录持仓信息失败：{str(e)}")
             raise
 
+    def open_position(self, position):
+        """记录新开的持仓，返回持仓ID
+
+        Args:
+            position (Position): 新开的持仓，写入后会设置其id
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                sql = "INSERT INTO positions (symbol, position_type, quantity, entry_price, current_price, profit_loss, status) VALUES (%s, %s, %s, %s, %s, %s, %s)"
+                cursor.execute(sql, (position.symbol, position.side, position.quantity,
+                                     position.entry_price, position.entry_price, 0, 'open'))
+                position.id = cursor.lastrowid
+                sql = "INSERT INTO trades (symbol, trade_type, quantity, price) VALUES (%s, %s, %s, %s)"
+                cursor.execute(sql, (position.symbol, position.side, position.quantity, position.entry_price))
+                self.connection.commit()
+            return position.id
+        except Exception as e:
+            logger.error(f"记录持仓信息失败：{str(e)}")
+            raise
+
+    def get_open_positions(self, symbol=None):
+        """获取未平仓的持仓"""
+        try:
+            with self.connection.cursor() as cursor:
+                if symbol is None:
+                    sql = "SELECT * FROM positions WHERE status = 'open' ORDER BY id"
+                    cursor.execute(sql)
+                else:
+                    sql = "SELECT * FROM positions WHERE status = 'open' AND symbol = %s ORDER BY id"
+                    cursor.execute(sql, (symbol,))
+                return [Position.from_row(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"获取持仓信息失败：{str(e)}")
+            raise
+
+    def close_position(self, position_id, close_price, close_order_id, profit, fee=0):
+        """平仓并记录平仓交易，盈亏按扣除手续费后的净值记录"""
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("SELECT symbol, quantity FROM positions WHERE id = %s", (position_id,))
+                row = cursor.fetchone()
+                sql = "UPDATE positions SET current_price = %s, profit_loss = %s, status = 'closed' WHERE id = %s"
+                cursor.execute(sql, (close_price, profit - fee, position_id))
+                if row:
+                    sql = "INSERT INTO trades (symbol, trade_type, quantity, price, profit_loss) VALUES (%s, %s, %s, %s, %s)"
+                    cursor.execute(sql, (row['symbol'], 'close', row['quantity'], close_price, profit - fee))
+                self.connection.commit()
+            logger.info(f"持仓{position_id}已平仓，平仓订单ID：{close_order_id}")
+        except Exception as e:
+            logger.error(f"更新平仓信息失败：{str(e)}")
+            raise
+
     def record_trade(self, symbol, trade_type, quantity, price, profit_loss=None):
         try:
             with self.connection.cursor() as cursor:
@@ -111,6 +226,53 @@ class Database:
             logger.error(f"获取交易对配置失败：{str(e)}")
             raise
 
+    def get_all_trading_pairs(self):
+        """获取所有交易对配置（包含未激活的）"""
+        try:
+            with self.connection.cursor() as cursor:
+                sql = "SELECT * FROM trading_pairs ORDER BY id"
+                cursor.execute(sql)
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"获取交易对配置失败：{str(e)}")
+            raise
+
+    def get_trading_pairs_version(self):
+        """获取交易对配置的版本信息，用于轮询变更
+
+        只返回一行聚合结果，开销与交易对数量无关。
+        """
+        try:
+            self.refresh_snapshot()
+            with self.connection.cursor() as cursor:
+                sql = """
+                SELECT COUNT(*) AS total,
+                       MAX(updated_at) AS version,
+                       SUM(UNIX_TIMESTAMP(updated_at)) AS checksum,
+                       NOW() AS db_time
+                FROM trading_pairs
+                """
+                cursor.execute(sql)
+                return cursor.fetchone()
+        except Exception as e:
+            logger.error(f"获取交易对配置版本失败：{str(e)}")
+            raise
+
+    def get_trading_pairs_changed_since(self, since=None):
+        """获取updated_at不早于since的交易对配置（包含未激活的）"""
+        try:
+            with self.connection.cursor() as cursor:
+                if since is None:
+                    sql = "SELECT * FROM trading_pairs ORDER BY updated_at"
+                    cursor.execute(sql)
+                else:
+                    sql = "SELECT * FROM trading_pairs WHERE updated_at >= %s ORDER BY updated_at"
+                    cursor.execute(sql, (since,))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"获取变更的交易对配置失败：{str(e)}")
+            raise
+
     def add_trading_pair(self, symbol, quantity, price_drop=10, price_rise=10, 
                         long_profit=50, short_profit=50, status=1):
         """添加新的交易对配置"""
@@ -163,4 +325,70 @@ class Database:
                 self.connection.commit()
         except Exception as e:
             logger.error(f"更新交易对配置失败：{str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    def upsert_metric_rollups(self, rows):
+        """写入指标汇总，已存在的时间桶与新数据合并
+
+        Args:
+            rows (list): (series, resolution, bucket, open, high, low, close, total, samples)元组列表
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                sql = """
+                INSERT INTO metric_rollups
+                (series, resolution, bucket, open, high, low, close, total, samples)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    high = GREATEST(high, VALUES(high)),
+                    low = LEAST(low, VALUES(low)),
+                    close = VALUES(close),
+                    total = total + VALUES(total),
+                    samples = samples + VALUES(samples)
+                """
+                cursor.executemany(sql, rows)
+                self.connection.commit()
+        except Exception as e:
+            logger.error(f"写入指标汇总失败：{str(e)}")
+            raise
+
+    def get_metric_rollups(self, series, resolution, since=None, until=None):
+        """按时间顺序获取一个指标的汇总数据"""
+        try:
+            self.refresh_snapshot()
+            with self.connection.cursor() as cursor:
+                sql = "SELECT bucket, open, high, low, close, total, samples FROM metric_rollups WHERE series = %s AND resolution = %s"
+                params = [series, resolution]
+                if since is not None:
+                    sql += " AND bucket >= %s"
+                    params.append(since)
+                if until is not None:
+                    sql += " AND bucket < %s"
+                    params.append(until)
+                cursor.execute(sql + " ORDER BY bucket", params)
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"获取指标汇总失败：{str(e)}")
+            raise
+
+    def get_metric_series(self, prefix=''):
+        """获取已记录的指标名称"""
+        try:
+            with self.connection.cursor() as cursor:
+                sql = "SELECT DISTINCT series FROM metric_rollups WHERE resolution = '1d' AND series LIKE %s ORDER BY series"
+                cursor.execute(sql, (prefix + '%',))
+                return [row['series'] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"获取指标名称失败：{str(e)}")
+            raise
+
+    def delete_metric_rollups_before(self, resolution, before):
+        """删除指定粒度中早于before的汇总数据"""
+        try:
+            with self.connection.cursor() as cursor:
+                sql = "DELETE FROM metric_rollups WHERE resolution = %s AND bucket < %s"
+                cursor.execute(sql, (resolution, before))
+                self.connection.commit()
+        except Exception as e:
+            logger.error(f"清理指标汇总失败：{str(e)}")
+            raise
@@ -2,6 +2,14 @@ import ccxt
 import time
 from loguru import logger
 from database import Database
+from circuit_breaker import get_breaker, CircuitBreaker, CircuitOpenError
+from exchange_adapter import create_exchange, LiveExchange, ReplayFinished
+from market_rules import get_symbol_rules
+from order_book import start_binance_depth_stream
+from positions import Position
+from profiler import profiler, setup_profiler
+from risk_engine import get_risk_engine, size_order
+from timeseries_store import get_timeseries_store
 import os
 from dotenv import load_dotenv
 
@@ -17,53 +25,95 @@ logger.add(
 )
 
 class ETHGridTrading:
+    # 交易参数（价格点数），batch_backtest --strategy eth按同一组参数回测
+    symbol = 'ETH/USDT'
+    trade_amount = 0.1  # 每次交易数量
+    price_drop_threshold = 10  # 跌多少开多单
+    price_rise_threshold = 10  # 涨多少开空单
+    long_profit_threshold = 50  # 多单获利平仓阈值
+    short_profit_threshold = 50  # 空单获利平仓阈值
+
+    @classmethod
+    def grid_params(cls):
+        """策略参数，格式与trading_pairs行相同，阈值为价格点数且始终保持一个多单和一个空单"""
+        return {
+            'symbol': cls.symbol,
+            'quantity': cls.trade_amount,
+            'price_drop': cls.price_drop_threshold,
+            'price_rise': cls.price_rise_threshold,
+            'long_profit': cls.long_profit_threshold,
+            'short_profit': cls.short_profit_threshold,
+            'percent': False,
+            'keep_both_sides': True
+        }
+
     def __init__(self):
         """初始化交易参数"""
-        # 初始化交易所API
-        self.exchange = ccxt.binance({
+        # 初始化交易所API，EXCHANGE_MODE选择实盘、模拟撮合或回放，代理通过EXCHANGE_PROXY设置
+        self.exchange = create_exchange(config={
             'apiKey': os.getenv('API_KEY'),
             'secret': os.getenv('API_SECRET'),
             'enableRateLimit': True,
             'options': {
                 'defaultType': 'future',
                 'hedgeMode': True
-            },
-            'proxies': {
-                'http': 'socks5://localhost:7897',
-                'https': 'socks5://localhost:7897'
             }
         })
         
-        # 设置交易参数
-        self.symbol = 'ETH/USDT'
-        self.trade_amount = 0.1  # 每次交易数量
-        self.price_drop_threshold = 10  # 跌多少开多单
-        self.price_rise_threshold = 10  # 涨多少开空单
-        self.long_profit_threshold = 50  # 多单获利平仓阈值
-        self.short_profit_threshold = 50  # 空单获利平仓阈值
-        
         # 初始化数据库连接
         self.db = Database()
         
+        # 权益、价格、敞口和盈亏的时间序列汇总，供看板展示
+        self.metrics = get_timeseries_store(self.db, source='eth_futures')
+        
         # 记录上次检查K线的时间
         self.last_kline_check = 0
         
+        self.loop_interval = float(os.getenv('LOOP_INTERVAL', 5))
+        
+        # 接口熔断器，以及主循环出错时的指数退避
+        self.ticker_breaker = get_breaker(f"{self.symbol}:ticker")
+        self.order_breaker = get_breaker(f"{self.symbol}:order")
+        self.loop_backoff = CircuitBreaker(f"{self.symbol}:loop", failure_threshold=1)
+        
+        # 可选的本地订单簿（合约差量深度流），同步时用微观价格触发并按盘口深度限制下单数量
+        self.order_book = None
+        self.max_slippage_bps = float(os.getenv('ORDER_BOOK_MAX_SLIPPAGE_BPS', 10))
+        
+        # 组合风险引擎，与同进程的其他交易实例共享
+        self.risk = get_risk_engine()
+        
         # 初始化检查
         self._initialize()
     
     def _initialize(self):
-        """初始化检查"""
+        """初始化检查
+
+        API连接在run()开始时通过check_balance检查，这里只校验交易对，
+        市场信息优先使用磁盘缓存。
+        """
         try:
-            # 测试API连接
-            self.exchange.fetch_balance()
-            logger.info("API连接成功")
-            
-            # 检查交易对是否存在
-            markets = self.exchange.load_markets()
-            if self.symbol not in markets:
+            # 检查交易对是否存在，实盘优先使用市场信息磁盘缓存，模拟和回放交易所按需生成交易对信息
+            if not self.exchange.markets:
+                self.exchange.load_markets()
+            try:
+                self.exchange.market(self.symbol)
+            except ccxt.BadSymbol:
                 raise Exception(f"交易对 {self.symbol} 不存在")
             logger.info(f"交易对 {self.symbol} 验证成功")
             
+            # 预先解析下单过滤规则（步长、最小变动价位、最小名义价值）
+            self.rules = get_symbol_rules(self.exchange, self.symbol)
+            
+            # 已有持仓计入组合敞口
+            for position in self.db.get_open_positions(self.symbol):
+                self.risk.on_fill(self.symbol, position.side, position.quantity, position.entry_price)
+            
+            if os.getenv('ORDER_BOOK_STREAM', '0') == '1' and isinstance(self.exchange, LiveExchange):
+                self.order_book, self.depth_stream = start_binance_depth_stream(
+                    self.exchange, self.symbol, futures=True
+                )
+            
         except Exception as e:
             logger.error(f"初始化失败：{str(e)}")
             raise
@@ -73,6 +123,8 @@ class ETHGridTrading:
         try:
             balance = self.exchange.fetch_balance()
             usdt_balance = balance['USDT']['free']
+            self.risk.update_equity(balance['USDT']['total'])
+            self.metrics.record_source('equity', balance['USDT']['total'], self.exchange.milliseconds() / 1000)
             
             logger.info(f"当前余额：")
             logger.info(f"USDT：{usdt_balance}")
@@ -84,11 +136,26 @@ class ETHGridTrading:
         except Exception as e:
             logger.error(f"检查余额失败：{str(e)}")
     
+    def record_metrics(self, price, open_positions):
+        """记录价格、浮动盈亏和组合敞口"""
+        timestamp = self.exchange.milliseconds() / 1000
+        self.metrics.record(f"price:{self.symbol}", price, timestamp)
+        unrealized = sum(position.profit(price) for position in open_positions)
+        self.metrics.record_source(f"unrealized:{self.symbol}", unrealized, timestamp)
+        self.metrics.record_source('exposure', self.risk.total_notional, timestamp)
+    
     def get_current_price(self):
         """获取当前价格"""
         try:
-            ticker = self.exchange.fetch_ticker(self.symbol)
+            if self.order_book is not None and self.order_book.is_fresh():
+                return self.order_book.microprice()
+            ticker = self.ticker_breaker.call(self.exchange.fetch_ticker, self.symbol)
             return ticker['last']
+        except ReplayFinished:
+            raise
+        except CircuitOpenError as e:
+            logger.warning(str(e))
+            return None
         except Exception as e:
             logger.error(f"获取价格失败：{str(e)}")
             return None
@@ -97,7 +164,8 @@ class ETHGridTrading:
         """获取1小时K线数据"""
         try:
             # 获取最近的1小时K线数据
-            klines = self.exchange.fetch_ohlcv(
+            klines = self.ticker_breaker.call(
+                self.exchange.fetch_ohlcv,
                 self.symbol,
                 timeframe='1h',
                 limit=1
@@ -121,7 +189,7 @@ class ETHGridTrading:
     
     def should_check_positions(self):
         """判断是否需要检查持仓"""
-        current_time = time.time()
+        current_time = self.exchange.milliseconds() / 1000
         # 每5分钟检查一次
         if current_time - self.last_kline_check >= 300:  # 5分钟 = 300秒
             self.last_kline_check = current_time
@@ -131,26 +199,31 @@ class ETHGridTrading:
     def place_long_order(self, price):
         """开多单"""
         try:
+            amount = size_order(self.order_book, self.risk, self.rules, self.symbol, 'long',
+                                self.trade_amount, price, self.max_slippage_bps)
+            if amount is None:
+                return None
+            
             # 创建市价买单
-            order = self.exchange.create_market_buy_order(
-                self.symbol,
-                self.trade_amount,
-                params={
-                    'type': 'market',
-                    'positionSide': 'LONG'
-                }
-            )
+            with profiler.phase('order'):
+                order = self.order_breaker.call(
+                    self.exchange.create_market_buy_order,
+                    self.symbol,
+                    amount,
+                    params={
+                        'type': 'market',
+                        'positionSide': 'LONG'
+                    }
+                )
+            # 成交后立即计入组合敞口，数据库写入失败也不影响风控
+            self.risk.on_fill(self.symbol, 'long', amount, price)
             
             # 记录持仓
-            position_id = self.db.record_position(
-                symbol=self.symbol,
-                position_type='long',
-                amount=self.trade_amount,
-                price=price,
-                order_id=order['id']
-            )
+            position = Position.from_order(self.symbol, 'long', amount, price, order)
+            with profiler.phase('db'):
+                position_id = self.db.open_position(position)
             
-            logger.info(f"开多单成功：价格={price}, 数量={self.trade_amount}, 订单ID={order['id']}")
+            logger.info(f"开多单成功：价格={price}, 数量={amount}, 订单ID={order['id']}")
             return position_id
             
         except ccxt.InsufficientFunds as e:
@@ -164,26 +237,31 @@ class ETHGridTrading:
     def place_short_order(self, price):
         """开空单"""
         try:
+            amount = size_order(self.order_book, self.risk, self.rules, self.symbol, 'short',
+                                self.trade_amount, price, self.max_slippage_bps)
+            if amount is None:
+                return None
+            
             # 创建市价卖单
-            order = self.exchange.create_market_sell_order(
-                self.symbol,
-                self.trade_amount,
-                params={
-                    'type': 'market',
-                    'positionSide': 'SHORT'
-                }
-            )
+            with profiler.phase('order'):
+                order = self.order_breaker.call(
+                    self.exchange.create_market_sell_order,
+                    self.symbol,
+                    amount,
+                    params={
+                        'type': 'market',
+                        'positionSide': 'SHORT'
+                    }
+                )
+            # 成交后立即计入组合敞口，数据库写入失败也不影响风控
+            self.risk.on_fill(self.symbol, 'short', amount, price)
             
             # 记录持仓
-            position_id = self.db.record_position(
-                symbol=self.symbol,
-                position_type='short',
-                amount=self.trade_amount,
-                price=price,
-                order_id=order['id']
-            )
+            position = Position.from_order(self.symbol, 'short', amount, price, order)
+            with profiler.phase('db'):
+                position_id = self.db.open_position(position)
             
-            logger.info(f"开空单成功：价格={price}, 数量={self.trade_amount}, 订单ID={order['id']}")
+            logger.info(f"开空单成功：价格={price}, 数量={amount}, 订单ID={order['id']}")
             return position_id
             
         except ccxt.InsufficientFunds as e:
@@ -198,41 +276,51 @@ class ETHGridTrading:
         """平多单"""
         try:
             # 获取持仓信息
-            positions = self.db.get_open_positions(self.symbol)
-            position = next((p for p in positions if p[0] == position_id), None)
+            with profiler.phase('db'):
+                positions = self.db.get_open_positions(self.symbol)
+            position = next((p for p in positions if p.id == position_id), None)
             
             if not position:
                 logger.error(f"未找到持仓ID：{position_id}")
                 return False
             
+            # 按步长取整
+            amount = self.rules.round_amount(position.quantity)
+            entry_price = position.entry_price
+            
             # 创建市价卖单
-            order = self.exchange.create_market_sell_order(
-                self.symbol,
-                position[3],  # amount
-                params={
-                    'type': 'market',
-                    'positionSide': 'LONG'
-                }
-            )
+            with profiler.phase('order'):
+                order = self.order_breaker.call(
+                    self.exchange.create_market_sell_order,
+                    self.symbol,
+                    amount,
+                    params={
+                        'type': 'market',
+                        'positionSide': 'LONG'
+                    }
+                )
+            self.risk.on_fill(self.symbol, 'long', -amount, current_price)
             
             # 计算盈利
-            buy_value = position[4] * position[3]  # entry_price * amount
-            sell_value = current_price * position[3]
+            buy_value = entry_price * amount
+            sell_value = current_price * amount
             profit = sell_value - buy_value
             
             # 获取手续费
             fee = order.get('fee', {}).get('cost', 0)
             
             # 更新数据库
-            self.db.close_position(
-                position_id=position_id,
-                close_price=current_price,
-                close_order_id=order['id'],
-                profit=profit,
-                fee=fee
-            )
+            with profiler.phase('db'):
+                self.db.close_position(
+                    position_id=position_id,
+                    close_price=current_price,
+                    close_order_id=order['id'],
+                    profit=profit,
+                    fee=fee
+                )
+            self.metrics.record(f"realized:{self.symbol}", profit - fee, self.exchange.milliseconds() / 1000)
             
-            logger.info(f"平多单成功：开仓价={position[4]}, 平仓价={current_price}, ")
+            logger.info(f"平多单成功：开仓价={entry_price}, 平仓价={current_price}, ")
             logger.info(f"毛利润={profit}, 手续费={fee}, 净利润={profit-fee}")
             
             return True
@@ -245,41 +333,51 @@ class ETHGridTrading:
         """平空单"""
         try:
             # 获取持仓信息
-            positions = self.db.get_open_positions(self.symbol)
-            position = next((p for p in positions if p[0] == position_id), None)
+            with profiler.phase('db'):
+                positions = self.db.get_open_positions(self.symbol)
+            position = next((p for p in positions if p.id == position_id), None)
             
             if not position:
                 logger.error(f"未找到持仓ID：{position_id}")
                 return False
             
+            # 按步长取整
+            amount = self.rules.round_amount(position.quantity)
+            entry_price = position.entry_price
+            
             # 创建市价买单
-            order = self.exchange.create_market_buy_order(
-                self.symbol,
-                position[3],  # amount
-                params={
-                    'type': 'market',
-                    'positionSide': 'SHORT'
-                }
-            )
+            with profiler.phase('order'):
+                order = self.order_breaker.call(
+                    self.exchange.create_market_buy_order,
+                    self.symbol,
+                    amount,
+                    params={
+                        'type': 'market',
+                        'positionSide': 'SHORT'
+                    }
+                )
+            self.risk.on_fill(self.symbol, 'short', -amount, current_price)
             
             # 计算盈利
-            sell_value = position[4] * position[3]  # entry_price * amount
-            buy_value = current_price * position[3]
+            sell_value = entry_price * amount
+            buy_value = current_price * amount
             profit = sell_value - buy_value
             
             # 获取手续费
             fee = order.get('fee', {}).get('cost', 0)
             
             # 更新数据库
-            self.db.close_position(
-                position_id=position_id,
-                close_price=current_price,
-                close_order_id=order['id'],
-                profit=profit,
-                fee=fee
-            )
+            with profiler.phase('db'):
+                self.db.close_position(
+                    position_id=position_id,
+                    close_price=current_price,
+                    close_order_id=order['id'],
+                    profit=profit,
+                    fee=fee
+                )
+            self.metrics.record(f"realized:{self.symbol}", profit - fee, self.exchange.milliseconds() / 1000)
             
-            logger.info(f"平空单成功：开仓价={position[4]}, 平仓价={current_price}, ")
+            logger.info(f"平空单成功：开仓价={entry_price}, 平仓价={current_price}, ")
             logger.info(f"毛利润={profit}, 手续费={fee}, 净利润={profit-fee}")
             
             return True
@@ -299,6 +397,9 @@ class ETHGridTrading:
         logger.info(f"多单获利平仓阈值：{self.long_profit_threshold}")
         logger.info(f"空单获利平仓阈值：{self.short_profit_threshold}")
         
+        # 测试API连接并检查余额
+        self.check_balance()
+        
         last_price = self.get_current_price()
         if last_price is None:
             return
@@ -306,10 +407,13 @@ class ETHGridTrading:
         while True:
             try:
                 # 获取当前价格
-                current_price = self.get_current_price()
+                with profiler.phase('price_fetch'):
+                    current_price = self.get_current_price()
                 if current_price is None:
-                    time.sleep(5)
+                    # 熔断期间等到允许探测时再重试
+                    time.sleep(max(self.ticker_breaker.retry_after(), 1))
                     continue
+                self.risk.on_mark(self.symbol, current_price)
                 
                 price_change = current_price - last_price
                 
@@ -324,11 +428,14 @@ class ETHGridTrading:
                     last_price = current_price
                 
                 # 获取当前持仓
-                open_positions = self.db.get_open_positions(self.symbol)
+                with profiler.phase('db'):
+                    open_positions = self.db.get_open_positions(self.symbol)
+                
+                self.record_metrics(current_price, open_positions)
                 
                 # 检查多空持仓情况
-                long_positions = sum(1 for p in open_positions if p[2] == 'long')
-                short_positions = sum(1 for p in open_positions if p[2] == 'short')
+                long_positions = sum(1 for p in open_positions if p.side == 'long')
+                short_positions = sum(1 for p in open_positions if p.side == 'short')
                 
                 # 如果没有多仓，开一个多单
                 if long_positions == 0:
@@ -344,47 +451,63 @@ class ETHGridTrading:
                 
                 # 检查是否到达整点
                 if self.should_check_positions():
+                    # 更新账户权益
+                    self.check_balance()
+                    
                     # 获取1小时K线数据
-                    kline = self.get_hourly_kline()
+                    with profiler.phase('price_fetch'):
+                        kline = self.get_hourly_kline()
                     if kline:
                         close_price = kline['close']
                         logger.info(f"1小时K线收盘价：{close_price}")
                         
                         # 检查持仓是否需要平仓
                         for position in open_positions:
-                            position_id = position[0]
-                            position_type = position[2]
-                            entry_price = float(position[4])  # 转换为float类型
+                            profit = position.profit_points(close_price)
                             
                             # 使用1小时K线收盘价检查是否需要平仓
-                            if position_type == 'long' and close_price - entry_price >= self.long_profit_threshold:
-                                self.close_long_position(position_id, close_price)
-                            elif position_type == 'short' and entry_price - close_price >= self.short_profit_threshold:
-                                self.close_short_position(position_id, close_price)
+                            if position.side == 'long' and profit >= self.long_profit_threshold:
+                                self.close_long_position(position.id, close_price)
+                            elif position.side == 'short' and profit >= self.short_profit_threshold:
+                                self.close_short_position(position.id, close_price)
                 
                 # 输出当前持仓信息
                 if open_positions:
-                    long_positions = sum(1 for p in open_positions if p[2] == 'long')
-                    short_positions = sum(1 for p in open_positions if p[2] == 'short')
-                    logger.info(f"当前持仓情况：")
-                    logger.info(f"多单数量：{long_positions}")
-                    logger.info(f"空单数量：{short_positions}")
+                    with profiler.phase('logging'):
+                        long_positions = sum(1 for p in open_positions if p.side == 'long')
+                        short_positions = sum(1 for p in open_positions if p.side == 'short')
+                        logger.info(f"当前持仓情况：")
+                        logger.info(f"多单数量：{long_positions}")
+                        logger.info(f"空单数量：{short_positions}")
+                
+                self.loop_backoff.record_success()
                 
                 # 添加适当的延迟，避免触发币安API限制
-                time.sleep(5)
+                with profiler.phase('sleep'):
+                    time.sleep(self.loop_interval)
                 
+            except ReplayFinished as e:
+                logger.info(f"回放结束：{str(e)}")
+                self.metrics.flush()
+                break
+            # 出错后按抖动的指数退避等待，连续出错时等待时间逐步加长
             except ccxt.NetworkError as e:
                 logger.error(f"网络错误：{str(e)}")
-                time.sleep(10)  # 网络错误时等待更长时间
+                self.loop_backoff.record_failure()
+                time.sleep(self.loop_backoff.retry_after())
             except ccxt.ExchangeError as e:
                 logger.error(f"交易所错误：{str(e)}")
-                time.sleep(5)
+                self.loop_backoff.record_failure()
+                time.sleep(self.loop_backoff.retry_after())
             except Exception as e:
                 logger.error(f"运行错误：{str(e)}")
-                time.sleep(5)
+                self.loop_backoff.record_failure()
+                time.sleep(self.loop_backoff.retry_after())
 
 if __name__ == '__main__':
     try:
+        setup_profiler()
+        
         # 创建交易实例
         trader = ETHGridTrading()
         
@@ -392,5 +515,7 @@ if __name__ == '__main__':
         trader.run()
     except KeyboardInterrupt:
         logger.info("程序被用户中断")
+    except ReplayFinished as e:
+        logger.info(f"回放结束：{str(e)}")
     except Exception as e:
         logger.error(f"程序异常退出：{str(e)}")
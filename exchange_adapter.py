@@ -0,0 +1,657 @@
+from loguru import logger
+from exchange_cache import get_exchange, load_markets_cached
+from fill_model import FeeSchedule
+from market_rules import TICK_SIZE
+from order_book import LocalOrderBook, replay_depth_file
+from trading_mode import get_exchange_mode
+from abc import ABC, abstractmethod
+import itertools
+import os
+import random
+import time
+
+# K线周期（毫秒）
+TIMEFRAMES = {
+    '1m': 60000, '5m': 300000, '15m': 900000, '30m': 1800000,
+    '1h': 3600000, '4h': 14400000, '1d': 86400000
+}
+
+class ReplayFinished(Exception):
+    """回放数据已用完"""
+
+class ExchangeAdapter(ABC):
+    """交易所接口
+
+    策略只通过以下ccxt风格的方法访问交易所，实盘（LiveExchange）、
+    模拟撮合（SimulatedExchange）和回放（PaperExchange）三种实现可以互换。
+    缺少任一抽象方法的实现在创建实例时即报错。
+    """
+
+    id = None
+    options = {}
+    markets = None
+    precisionMode = TICK_SIZE
+
+    @abstractmethod
+    def load_markets(self):
+        pass
+
+    @abstractmethod
+    def market(self, symbol):
+        pass
+
+    @abstractmethod
+    def milliseconds(self):
+        """交易所时间（毫秒），模拟和回放时为数据时间"""
+
+    @abstractmethod
+    def fetch_ticker(self, symbol):
+        pass
+
+    @abstractmethod
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None):
+        pass
+
+    @abstractmethod
+    def fetch_order_book(self, symbol, limit=None):
+        pass
+
+    @abstractmethod
+    def fetch_balance(self):
+        pass
+
+    @abstractmethod
+    def fetch_positions(self, symbols=None):
+        pass
+
+    @abstractmethod
+    def create_order(self, symbol, type, side, amount, price=None, params=None):
+        pass
+
+    @abstractmethod
+    def cancel_order(self, id, symbol=None):
+        pass
+
+    def create_market_buy_order(self, symbol, amount, params=None):
+        return self.create_order(symbol, 'market', 'buy', amount, params=params)
+
+    def create_market_sell_order(self, symbol, amount, params=None):
+        return self.create_order(symbol, 'market', 'sell', amount, params=params)
+
+    def create_limit_buy_order(self, symbol, amount, price, params=None):
+        return self.create_order(symbol, 'limit', 'buy', amount, price, params)
+
+    def create_limit_sell_order(self, symbol, amount, price, params=None):
+        return self.create_order(symbol, 'limit', 'sell', amount, price, params)
+
+class LiveExchange(ExchangeAdapter):
+    """通过ccxt连接实盘交易所，实例由exchange_cache.get_exchange共享"""
+
+    def __init__(self, exchange_id='binance', config=None):
+        self.client = get_exchange(exchange_id, config)
+
+    @property
+    def id(self):
+        return self.client.id
+
+    @property
+    def options(self):
+        return self.client.options
+
+    @property
+    def markets(self):
+        return self.client.markets
+
+    @property
+    def precisionMode(self):
+        return self.client.precisionMode
+
+    def load_markets(self):
+        return load_markets_cached(self.client)
+
+    def market(self, symbol):
+        return self.client.market(symbol)
+
+    def milliseconds(self):
+        return self.client.milliseconds()
+
+    def fetch_ticker(self, symbol):
+        return self.client.fetch_ticker(symbol)
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None):
+        return self.client.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=limit)
+
+    def fetch_order_book(self, symbol, limit=None):
+        return self.client.fetch_order_book(symbol, limit=limit)
+
+    def fetch_balance(self):
+        return self.client.fetch_balance()
+
+    def fetch_positions(self, symbols=None):
+        return self.client.fetch_positions(symbols)
+
+    def create_order(self, symbol, type, side, amount, price=None, params=None):
+        return self.client.create_order(symbol, type, side, amount, price, params or {})
+
+    def cancel_order(self, id, symbol=None):
+        return self.client.cancel_order(id, symbol)
+
+def make_market(symbol, price_step=0.01, amount_step=0.001, min_notional=5):
+    """生成模拟交易所使用的ccxt格式交易对信息"""
+    base, quote = symbol.split('/')
+    return {
+        'id': f"{base}{quote}",
+        'symbol': symbol,
+        'base': base,
+        'quote': quote,
+        'precision': {'amount': amount_step, 'price': price_step},
+        'limits': {
+            'amount': {'min': amount_step, 'max': None},
+            'price': {'min': price_step, 'max': None},
+            'cost': {'min': min_notional, 'max': None}
+        },
+        'info': {}
+    }
+
+class SimulatedExchange(ExchangeAdapter):
+    """进程内撮合的模拟交易所
+
+    每个交易对维护一个LocalOrderBook：市价单按盘口逐档吃单成交，成交数量从盘口扣除，
+    直到下一次行情更新；限价单能立即成交的部分吃单成交，其余挂在本地，行情穿越挂单价
+    时按挂单价成交。手续费按FeeSchedule的挂单/吃单费率从USDT余额扣除。
+
+    持仓按合约双向持仓模式记录：positionSide为LONG/SHORT时分别开平多空仓，
+    不传时按单向净持仓处理。开仓前按leverage估算保证金，不足时抛出ccxt.InsufficientFunds。
+
+    行情由feed驱动，每次fetch_ticker推进一步；没有feed时通过set_price/load_order_book推送。
+
+    Args:
+        balance (float): 初始USDT余额
+        fees (FeeSchedule): 手续费率
+        leverage (float): 杠杆倍数
+        default_type (str): 'spot'或'future'，用于区分交易对规则缓存
+        feed: 行情源，见RandomWalkFeed、CandleReplayFeed、DepthReplayFeed
+        spread_bps (float): set_price生成盘口时的买卖价差（基点）
+        level_size (float): set_price生成盘口时每档的数量
+        levels (int): set_price生成盘口时每侧的档数
+    """
+
+    id = 'simulated'
+
+    def __init__(self, balance=10000, fees=None, leverage=1, default_type='spot', feed=None,
+                 spread_bps=2, level_size=50, levels=20):
+        self.options = {'defaultType': default_type}
+        self.markets = {}
+        self.fees = fees or FeeSchedule()
+        self.leverage = leverage
+        self.feed = feed
+        self.spread_bps = spread_bps
+        self.level_size = level_size
+        self.levels = levels
+        self.cash = float(balance)  # 已实现盈亏和手续费计入后的钱包余额
+        self.books = {}
+        self.last_prices = {}
+        self.bars = {}  # 交易对 -> 1分钟K线列表
+        self.positions = {}  # (交易对, LONG/SHORT/BOTH) -> [数量, 开仓均价]，BOTH的数量带符号
+        self.open_orders = {}
+        self.fills = 0
+        self.fees_paid = 0.0
+        self.now = None  # 数据时间（毫秒），未推送行情前使用系统时间
+        # 订单号从启动时间（毫秒）开始编号，重启后不会与状态日志中恢复的订单号重复
+        self._ids = itertools.count(int(time.time() * 1000))
+        self._book_ids = itertools.count(1)
+
+    def load_markets(self):
+        return self.markets
+
+    def market(self, symbol):
+        market = self.markets.get(symbol)
+        if market is None:
+            market = make_market(symbol)
+            self.markets[symbol] = market
+        return market
+
+    def milliseconds(self):
+        return self.now if self.now is not None else int(time.time() * 1000)
+
+    def book(self, symbol):
+        book = self.books.get(symbol)
+        if book is None:
+            book = LocalOrderBook(symbol)
+            self.books[symbol] = book
+        return book
+
+    def load_order_book(self, symbol, snapshot, timestamp=None):
+        """用快照替换盘口"""
+        self.book(symbol).load_snapshot(snapshot)
+        self._on_book(symbol, timestamp)
+
+    def set_price(self, symbol, price, volume=0, timestamp=None):
+        """按价格生成对称盘口（spread_bps价差，每侧levels档），用于没有深度数据的行情"""
+        tick = self.market(symbol)['precision']['price']
+        half_spread = max(price * self.spread_bps / 20000, tick)
+        bid, ask = price - half_spread, price + half_spread
+        self.load_order_book(symbol, {
+            'lastUpdateId': next(self._book_ids),
+            'bids': [(bid - i * tick, self.level_size) for i in range(self.levels)],
+            'asks': [(ask + i * tick, self.level_size) for i in range(self.levels)]
+        }, timestamp)
+        self._update_bar(symbol, price, volume)
+
+    def _on_book(self, symbol, timestamp=None):
+        """盘口变化后更新时间、最新价并撮合挂单"""
+        if timestamp is not None:
+            self.now = int(timestamp)
+        book = self.books[symbol]
+        mid = book.mid()
+        if mid is None:
+            return
+        self.last_prices[symbol] = mid
+        self._match_resting(symbol)
+
+    def _update_bar(self, symbol, price, volume):
+        bars = self.bars.setdefault(symbol, [])
+        start = self.milliseconds() // 60000 * 60000
+        if bars and bars[-1][0] == start:
+            bar = bars[-1]
+            bar[2] = max(bar[2], price)
+            bar[3] = min(bar[3], price)
+            bar[4] = price
+            bar[5] += volume
+        else:
+            bars.append([start, price, price, price, price, volume])
+
+    def _advance(self, symbol):
+        if self.feed is not None:
+            self.feed.advance(self, symbol)
+        if symbol not in self.last_prices:
+            import ccxt
+            raise ccxt.ExchangeNotAvailable(f"{symbol}没有行情数据")
+
+    def fetch_ticker(self, symbol):
+        self._advance(symbol)
+        book = self.books[symbol]
+        return {
+            'symbol': symbol,
+            'timestamp': self.milliseconds(),
+            'last': self.last_prices[symbol],
+            'close': self.last_prices[symbol],
+            'bid': book.best_bid(),
+            'ask': book.best_ask()
+        }
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None):
+        """由1分钟K线合成指定周期的K线"""
+        period = TIMEFRAMES[timeframe]
+        bars = self.bars.get(symbol, [])
+        if limit:
+            bars = bars[-limit * (period // 60000) - 1:]
+        result = []
+        for bar in bars:
+            if since is not None and bar[0] < since:
+                continue
+            start = bar[0] // period * period
+            if result and result[-1][0] == start:
+                merged = result[-1]
+                merged[2] = max(merged[2], bar[2])
+                merged[3] = min(merged[3], bar[3])
+                merged[4] = bar[4]
+                merged[5] += bar[5]
+            else:
+                result.append([start, bar[1], bar[2], bar[3], bar[4], bar[5]])
+        return result[-limit:] if limit else result
+
+    def fetch_order_book(self, symbol, limit=None):
+        book = self.book(symbol)
+        return {
+            'symbol': symbol,
+            'bids': book.bids.levels(limit),
+            'asks': book.asks.levels(limit),
+            'nonce': book.last_update_id,
+            'timestamp': self.milliseconds()
+        }
+
+    def _unrealized(self):
+        total = 0.0
+        for (symbol, position_side), (amount, entry) in self.positions.items():
+            price = self.last_prices.get(symbol, entry)
+            if position_side == 'SHORT':
+                total += (entry - price) * amount
+            else:
+                total += (price - entry) * amount
+        return total
+
+    def _used_margin(self):
+        return sum(abs(amount) * entry for amount, entry in self.positions.values()) / self.leverage
+
+    def fetch_balance(self):
+        total = self.cash + self._unrealized()
+        used = self._used_margin()
+        usdt = {'free': total - used, 'used': used, 'total': total}
+        return {
+            'USDT': usdt,
+            'free': {'USDT': usdt['free']},
+            'used': {'USDT': usdt['used']},
+            'total': {'USDT': usdt['total']},
+            'info': {}
+        }
+
+    def fetch_positions(self, symbols=None):
+        result = []
+        for (symbol, position_side), (amount, entry) in self.positions.items():
+            if symbols and symbol not in symbols:
+                continue
+            if position_side == 'BOTH':
+                side = 'long' if amount > 0 else 'short'
+            else:
+                side = position_side.lower()
+            price = self.last_prices.get(symbol, entry)
+            result.append({
+                'symbol': symbol,
+                'side': side,
+                'contracts': abs(amount),
+                'entryPrice': entry,
+                'markPrice': price,
+                'unrealizedPnl': (price - entry) * amount * (-1 if position_side == 'SHORT' else 1),
+                'info': {'positionSide': position_side}
+            })
+        return result
+
+    def _signed(self, side, position_side, amount):
+        """订单对持仓的变化量：LONG/SHORT为持仓数量的增减，BOTH为带符号的净持仓变化"""
+        if position_side == 'SHORT':
+            return amount if side == 'sell' else -amount
+        if position_side == 'LONG':
+            return amount if side == 'buy' else -amount
+        return amount if side == 'buy' else -amount
+
+    def _check_order(self, symbol, side, amount, position_side, price):
+        import ccxt
+        if amount <= 0:
+            raise ccxt.InvalidOrder(f"{symbol}下单数量必须大于0")
+        change = self._signed(side, position_side, amount)
+        held = self.positions.get((symbol, position_side), [0.0, 0.0])[0]
+        if position_side != 'BOTH' and change < 0:
+            if -change > held + 1e-12:
+                raise ccxt.InvalidOrder(f"{symbol} {position_side}持仓{held}不足，无法平仓{amount}")
+            return
+        # 只有增加敞口的部分需要保证金
+        if position_side == 'BOTH' and held * change < 0:
+            change = max(abs(change) - abs(held), 0)
+        required = abs(change) * price / self.leverage + abs(change) * price * self.fees.taker
+        available = self.fetch_balance()['USDT']['free']
+        if required > available:
+            raise ccxt.InsufficientFunds(f"保证金不足：需要{required:.2f} USDT，可用{available:.2f} USDT")
+
+    def _apply_fill(self, symbol, side, position_side, price, amount, fee_rate):
+        """按成交更新持仓和余额"""
+        fee = price * amount * fee_rate
+        self.cash -= fee
+        self.fees_paid += fee
+        self.fills += 1
+
+        key = (symbol, position_side)
+        held, entry = self.positions.get(key, (0.0, 0.0))
+        change = self._signed(side, position_side, amount)
+        direction = -1 if position_side == 'SHORT' else 1
+
+        if held == 0 or held * change > 0:
+            # 开仓或加仓，更新开仓均价
+            new = held + change
+            entry = (abs(held) * entry + abs(change) * price) / abs(new)
+            held = new
+        else:
+            # 减仓，单向持仓时超出的部分反向开仓
+            closed = min(abs(change), abs(held))
+            sign = 1 if held > 0 else -1
+            self.cash += (price - entry) * closed * sign * direction
+            held += change
+            if abs(held) < 1e-12:
+                held = 0.0
+            elif held * sign < 0:
+                entry = price
+
+        if held == 0:
+            self.positions.pop(key, None)
+        else:
+            self.positions[key] = [held, entry]
+        return fee
+
+    def _take(self, symbol, side, amount, limit_price=None):
+        """吃单成交，返回成交列表[(价格, 数量)]，成交数量从盘口扣除"""
+        book = self.book(symbol)
+        levels = book.asks if side == 'buy' else book.bids
+        fills = []
+        remaining = amount
+        while remaining > 1e-12 and len(levels):
+            price, size = levels.best()
+            if limit_price is not None and (price > limit_price if side == 'buy' else price < limit_price):
+                break
+            fill = min(size, remaining)
+            fills.append((price, fill))
+            remaining -= fill
+            levels.update(price, size - fill if size - fill > 1e-12 else 0)
+        return fills
+
+    def _new_order(self, symbol, type, side, amount, price, position_side):
+        return {
+            'id': str(next(self._ids)),
+            'symbol': symbol,
+            'type': type,
+            'side': side,
+            'amount': amount,
+            'price': price,
+            'filled': 0.0,
+            'remaining': amount,
+            'cost': 0.0,
+            'average': None,
+            'fee': {'cost': 0.0, 'currency': 'USDT'},
+            'status': 'open',
+            'timestamp': self.milliseconds(),
+            'info': {'positionSide': position_side}
+        }
+
+    def _record_fills(self, order, fills, fee_rate):
+        position_side = order['info']['positionSide']
+        for price, amount in fills:
+            order['fee']['cost'] += self._apply_fill(order['symbol'], order['side'], position_side,
+                                                     price, amount, fee_rate)
+            order['filled'] += amount
+            order['cost'] += price * amount
+        order['remaining'] = order['amount'] - order['filled']
+        if order['filled']:
+            order['average'] = order['cost'] / order['filled']
+        if order['remaining'] <= 1e-12:
+            order['remaining'] = 0.0
+            order['status'] = 'closed'
+
+    def create_order(self, symbol, type, side, amount, price=None, params=None):
+        params = params or {}
+        self.market(symbol)
+        if symbol not in self.last_prices:
+            self._advance(symbol)
+        amount = float(amount)
+        position_side = params.get('positionSide', 'BOTH')
+        reference = price or self.last_prices[symbol]
+        self._check_order(symbol, side, amount, position_side, reference)
+
+        order = self._new_order(symbol, type, side, amount, price, position_side)
+        fills = self._take(symbol, side, amount, limit_price=price if type == 'limit' else None)
+        self._record_fills(order, fills, self.fees.taker)
+
+        if order['status'] == 'open':
+            if type == 'market':
+                # 盘口深度不足，剩余数量按交易所规则撤销
+                order['status'] = 'canceled'
+            else:
+                self.open_orders[order['id']] = order
+        return dict(order)
+
+    def cancel_order(self, id, symbol=None):
+        order = self.open_orders.pop(id, None)
+        if order is None:
+            import ccxt
+            raise ccxt.OrderNotFound(f"订单{id}不存在")
+        order['status'] = 'canceled'
+        return dict(order)
+
+    def _match_resting(self, symbol):
+        """行情穿越挂单价时按挂单价成交"""
+        if not self.open_orders:
+            return
+        book = self.books[symbol]
+        bid, ask = book.best_bid(), book.best_ask()
+        for order in list(self.open_orders.values()):
+            if order['symbol'] != symbol:
+                continue
+            crossed = (order['side'] == 'buy' and ask is not None and ask <= order['price']) or \
+                      (order['side'] == 'sell' and bid is not None and bid >= order['price'])
+            if crossed:
+                self._record_fills(order, [(order['price'], order['remaining'])], self.fees.maker)
+                del self.open_orders[order['id']]
+
+class RandomWalkFeed:
+    """随机游走行情，用于模拟模式下的测试和压测
+
+    Args:
+        start_price (float): 初始价格
+        volatility_bps (float): 每步价格变化的标准差（基点）
+        step_ms (int): 每步推进的数据时间（毫秒）
+        seed (int): 随机种子
+    """
+
+    def __init__(self, start_price=2000, volatility_bps=5, step_ms=1000, seed=None):
+        self.start_price = start_price
+        self.volatility_bps = volatility_bps
+        self.step_ms = step_ms
+        self.random = random.Random(seed)
+        self.now = int(time.time() * 1000)
+
+    def advance(self, exchange, symbol):
+        self.now += self.step_ms
+        price = exchange.last_prices.get(symbol, self.start_price)
+        price *= 1 + self.random.gauss(0, self.volatility_bps / 10000)
+        exchange.set_price(symbol, price, timestamp=self.now)
+
+class CandleReplayFeed:
+    """按本地K线缓存（candle_store）回放，每步推进一根K线，按收盘价生成盘口
+
+    Args:
+        timeframe (str): K线周期
+        since (int): 开始时间（毫秒）
+    """
+
+    def __init__(self, timeframe='1m', since=None):
+        self.timeframe = timeframe
+        self.since = since
+        self.candles = {}
+
+    def _load(self, symbol):
+        from candle_store import CandleStore
+        import numpy as np
+        df = CandleStore().load(symbol, self.timeframe, since=self.since, refresh=False)
+        if df.empty:
+            raise ReplayFinished(f"{symbol}没有{self.timeframe}K线缓存")
+        times = df.index.values.astype('datetime64[ms]').astype(np.int64)
+        return zip(times.tolist(), df['close'].tolist(), df['volume'].tolist())
+
+    def advance(self, exchange, symbol):
+        rows = self.candles.get(symbol)
+        if rows is None:
+            rows = self._load(symbol)
+            self.candles[symbol] = rows
+        row = next(rows, None)
+        if row is None:
+            raise ReplayFinished(f"{symbol}K线回放结束")
+        timestamp, close, volume = row
+        exchange.set_price(symbol, close, volume=volume, timestamp=timestamp)
+
+class DepthReplayFeed:
+    """按记录的深度文件（order_book.DepthRecorder）回放，每步应用一条差量更新
+
+    Args:
+        path_pattern (str): 文件路径，{symbol}替换为交易对（如ETH_USDT）
+    """
+
+    def __init__(self, path_pattern):
+        self.path_pattern = path_pattern
+        self.streams = {}
+
+    def advance(self, exchange, symbol):
+        stream = self.streams.get(symbol)
+        if stream is None:
+            path = self.path_pattern.format(symbol=symbol.replace('/', '_'))
+            stream = replay_depth_file(path, exchange.book(symbol))
+            self.streams[symbol] = stream
+        book = next(stream, None)
+        if book is None:
+            raise ReplayFinished(f"{symbol}深度回放结束")
+        exchange._on_book(symbol, book.event_time)
+        mid = book.mid()
+        if mid is not None:
+            exchange._update_bar(symbol, mid, 0)
+
+class PaperExchange(SimulatedExchange):
+    """回放驱动的模拟盘：行情来自K线缓存或深度记录文件，撮合、手续费和持仓同SimulatedExchange
+
+    数据时间随回放推进，程序不需要等待真实时间，可以全速运行。
+    """
+
+    id = 'paper'
+
+    def __init__(self, feed, **kwargs):
+        super().__init__(feed=feed, **kwargs)
+
+# 模拟和回放模式下进程内共享同一个账户
+_simulated = {}
+
+def create_exchange(mode=None, config=None):
+    """按模式创建交易所
+
+    Args:
+        mode (str): live（实盘，默认）、sim（随机游走行情模拟）或paper（回放模拟盘），
+            默认读取环境变量EXCHANGE_MODE
+        config (dict): ccxt配置，代理通过环境变量EXCHANGE_PROXY设置（如socks5://localhost:7897）
+    """
+    mode = mode or get_exchange_mode()
+    config = dict(config or {})
+    default_type = config.get('options', {}).get('defaultType', 'spot')
+
+    if mode == 'live':
+        proxy = os.getenv('EXCHANGE_PROXY')
+        if proxy:
+            config['proxies'] = {'http': proxy, 'https': proxy}
+        return LiveExchange('binance', config)
+
+    key = (mode, default_type)
+    exchange = _simulated.get(key)
+    if exchange is not None:
+        return exchange
+
+    settings = {
+        'balance': float(os.getenv('SIM_BALANCE', 10000)),
+        'leverage': float(os.getenv('SIM_LEVERAGE', 1)),
+        'fees': FeeSchedule(float(os.getenv('SIM_MAKER_FEE', 0.0002)), float(os.getenv('SIM_TAKER_FEE', 0.0004))),
+        'default_type': default_type
+    }
+    if mode == 'sim':
+        feed = RandomWalkFeed(
+            start_price=float(os.getenv('SIM_START_PRICE', 2000)),
+            volatility_bps=float(os.getenv('SIM_VOLATILITY_BPS', 5))
+        )
+        exchange = SimulatedExchange(feed=feed, **settings)
+    elif mode == 'paper':
+        depth_file = os.getenv('PAPER_DEPTH_FILE')
+        if depth_file:
+            feed = DepthReplayFeed(depth_file)
+        else:
+            days = os.getenv('PAPER_DAYS')
+            since = int((time.time() - float(days) * 86400) * 1000) if days else None
+            feed = CandleReplayFeed(os.getenv('PAPER_TIMEFRAME', '1m'), since)
+        exchange = PaperExchange(feed, **settings)
+    else:
+        raise ValueError(f"未知的交易所模式：{mode}")
+
+    logger.info(f"使用{mode}模式交易所，初始余额{settings['balance']} USDT")
+    _simulated[key] = exchange
+    return exchange
@@ -0,0 +1,80 @@
+from loguru import logger
+import json
+import os
+import time
+
+# 市场信息磁盘缓存配置
+MARKETS_CACHE_DIR = os.getenv('MARKETS_CACHE_DIR', '.markets_cache')
+MARKETS_CACHE_TTL = int(os.getenv('MARKETS_CACHE_TTL', 6 * 3600))  # 默认6小时
+
+# 进程内共享的交易所实例和市场信息
+_exchanges = {}
+_markets = {}  # 缓存文件路径 -> (加载时间, 市场信息)
+
+def get_exchange(exchange_id='binance', config=None):
+    """获取共享的交易所实例
+
+    相同配置的交易所实例在进程内只创建一次，创建时从磁盘缓存加载市场信息，
+    之后ccxt内部调用load_markets时不再发起网络请求。
+
+    Args:
+        exchange_id (str): ccxt交易所ID
+        config (dict): ccxt交易所配置
+    """
+    config = config or {}
+    key = (exchange_id, json.dumps(config, sort_keys=True))
+    exchange = _exchanges.get(key)
+    if exchange is None:
+        # 延迟导入，ccxt导入本身就需要较长时间
+        import ccxt
+        exchange = getattr(ccxt, exchange_id)(config)
+        try:
+            load_markets_cached(exchange)
+        except Exception as e:
+            # 加载失败不影响创建实例，ccxt会在首次调用接口时重新加载
+            logger.warning(f"加载{exchange_id}市场信息失败：{str(e)}")
+        _exchanges[key] = exchange
+    return exchange
+
+def _cache_path(exchange):
+    market_type = exchange.options.get('defaultType', 'spot')
+    return os.path.join(MARKETS_CACHE_DIR, f"{exchange.id}_{market_type}.json")
+
+def load_markets_cached(exchange, ttl=MARKETS_CACHE_TTL):
+    """加载市场信息，优先使用未过期的进程内缓存和磁盘缓存
+
+    Args:
+        exchange: ccxt交易所实例
+        ttl (int): 磁盘缓存有效期（秒）
+    """
+    path = _cache_path(exchange)
+
+    loaded_at, cached = _markets.get(path, (None, None))
+    if cached is not None and time.time() - loaded_at >= ttl:
+        cached = None
+    if cached is None and os.path.exists(path) and time.time() - os.path.getmtime(path) < ttl:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            _markets[path] = (os.path.getmtime(path), cached)
+        except Exception as e:
+            logger.warning(f"读取市场信息缓存失败：{str(e)}")
+            cached = None
+
+    if cached is not None:
+        exchange.set_markets(cached['markets'], cached.get('currencies'))
+        return exchange.markets
+
+    # 已加载过的实例需要reload，否则ccxt直接返回内存中过期的市场信息
+    markets = exchange.load_markets(True)
+    cached = {'markets': markets, 'currencies': exchange.currencies}
+    _markets[path] = (time.time(), cached)
+    try:
+        os.makedirs(MARKETS_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cached, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"写入市场信息缓存失败：{str(e)}")
+    return markets
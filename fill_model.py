@@ -0,0 +1,96 @@
+import numpy as np
+
+class FeeSchedule:
+    """挂单/吃单手续费率
+
+    Args:
+        maker (float): 挂单费率，网格价位在K线内被触及时按挂单成交
+        taker (float): 吃单费率，跳空越过网格价位时按开盘价吃单成交
+    """
+
+    def __init__(self, maker=0.0002, taker=0.0004):
+        self.maker = maker
+        self.taker = taker
+
+def no_slippage(size, volume):
+    """不计滑点"""
+    return np.zeros(np.shape(size))
+
+def sqrt_impact_slippage(base_bps=1.0, impact_bps=10.0):
+    """平方根冲击滑点模型
+
+    滑点比例 = (base_bps + impact_bps * sqrt(成交量 / K线成交量)) / 10000
+    """
+    def slippage(size, volume):
+        volume = np.where(volume > 0, volume, np.inf)
+        return (base_bps + impact_bps * np.sqrt(size / volume)) / 10000
+    return slippage
+
+class OHLCFillModel:
+    """基于OHLC的盘中路径成交模型
+
+    每根K线的价格路径近似为：上根收盘 -> 开盘 -> 先到的极值 -> 后到的极值 -> 收盘，
+    阳线先到最低价，阴线先到最高价。价格向下穿越网格价位触发买入，向上穿越触发卖出。
+    K线内触及的价位按网格价格挂单成交；开盘跳空越过的价位按开盘价吃单成交并计入滑点。
+    穿越检测在K线×路径段×网格价位上向量化计算，只有资金与持仓的更新按事件顺序执行。
+    """
+
+    def __init__(self, fees=None, slippage=None, chunk_size=100000):
+        self.fees = fees or FeeSchedule()
+        self.slippage = slippage or no_slippage
+        self.chunk_size = chunk_size
+
+    def path(self, open_, high, low, close):
+        """构造每根K线的5个路径点，返回形状为(n, 5)的数组"""
+        prev_close = np.concatenate(([open_[0]], close[:-1]))
+        bullish = close >= open_
+        first = np.where(bullish, low, high)
+        second = np.where(bullish, high, low)
+        return np.stack((prev_close, open_, first, second, close), axis=1)
+
+    def crossings(self, open_, high, low, close, levels):
+        """找出所有网格价位穿越事件，按时间顺序返回(K线索引, 价位索引, 方向, 是否跳空)
+
+        方向为1表示向下穿越（买入），-1表示向上穿越（卖出）。
+        """
+        levels = np.asarray(levels, dtype=np.float64)
+        points = self.path(open_, high, low, close)
+        bars, level_index, side, gap = [], [], [], []
+
+        for start in range(0, len(points), self.chunk_size):
+            chunk = points[start:start + self.chunk_size]
+            a = chunk[:, :-1, None]
+            b = chunk[:, 1:, None]
+            down = (b < a) & (levels >= b) & (levels < a)
+            up = (b > a) & (levels > a) & (levels <= b)
+            bar, segment, level = np.nonzero(down | up)
+            is_down = down[bar, segment, level]
+            # 同一路径段内，下跌时先穿越高价位，上涨时先穿越低价位
+            order = np.lexsort((np.where(is_down, -level, level), segment, bar))
+            bars.append(bar[order] + start)
+            level_index.append(level[order])
+            side.append(np.where(is_down[order], 1, -1))
+            gap.append(segment[order] == 0)
+
+        if not bars:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty, np.zeros(0, dtype=bool)
+        return np.concatenate(bars), np.concatenate(level_index), np.concatenate(side), np.concatenate(gap)
+
+    def fills(self, open_, high, low, close, volume, levels, notional):
+        """计算所有穿越事件的成交价格和手续费率
+
+        Args:
+            notional (float): 每格的成交金额，用于估算滑点
+
+        Returns:
+            dict: bar、level、side、price、fee_rate数组，按时间顺序排列
+        """
+        levels = np.asarray(levels, dtype=np.float64)
+        bar, level, side, gap = self.crossings(open_, high, low, close, levels)
+        price = np.where(gap, open_[bar], levels[level])
+        slip = np.where(gap, self.slippage(notional / price, volume[bar]), 0.0)
+        # 滑点总是不利方向：买入价格上移，卖出价格下移
+        price = price * (1 + side * slip)
+        fee_rate = np.where(gap, self.fees.taker, self.fees.maker)
+        return {'bar': bar, 'level': level, 'side': side, 'price': price, 'fee_rate': fee_rate}
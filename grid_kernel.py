@@ -0,0 +1,224 @@
+import numpy as np
+
+# Numba为可选依赖，未安装时内核以纯Python执行（结果相同，速度较慢）
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+@njit(cache=True)
+def _threshold_grid_kernel(close, quantity, price_drop, price_rise, long_profit, short_profit,
+                           fee_rate, percent, keep_both_sides, long_entry, short_entry, pnl):
+    """阈值网格状态机
+
+    percent为True时阈值为百分比（CryptoGridTrading），否则为价格点数（ETHGridTrading）。
+    keep_both_sides为True时始终保持至少一个多单和一个空单（ETHGridTrading.run中的规则），
+    每次开仓都会重置参考价格last_price。持仓开仓价保存在long_entry/short_entry中，
+    达到数组容量后不再开新仓。
+
+    多单获利随开仓价升高而减小，空单相反，因此每根K线只需检查最低的多单开仓价和
+    最高的空单开仓价，有持仓达到平仓条件时才遍历持仓；浮动盈亏由开仓价之和计算，
+    每根K线的开销与持仓数量无关。
+
+    Returns:
+        (已实现盈亏, 成交次数, 期末多单数, 期末空单数, 因容量不足跳过的开仓次数)
+    """
+    n_long = 0
+    n_short = 0
+    long_sum = 0.0
+    short_sum = 0.0
+    long_min = np.inf
+    short_max = -np.inf
+    realized = 0.0
+    trades = 0
+    skipped = 0
+    last_price = close[0]
+
+    for i in range(close.shape[0]):
+        price = close[i]
+        fee = price * quantity * fee_rate
+
+        if percent:
+            change = (price - last_price) / last_price * 100
+        else:
+            change = price - last_price
+
+        # 价格下跌开多单，价格上涨开空单
+        open_long = change <= -price_drop
+        open_short = not open_long and change >= price_rise
+        if open_long or open_short:
+            last_price = price
+
+        # 保持多空各至少一单
+        if keep_both_sides:
+            if n_long == 0 and not open_long:
+                open_long = True
+                last_price = price
+            if n_short == 0 and not open_short:
+                open_short = True
+                last_price = price
+
+        if open_long:
+            if n_long < long_entry.shape[0]:
+                long_entry[n_long] = price
+                n_long += 1
+                long_sum += price
+                long_min = min(long_min, price)
+                realized -= fee
+                trades += 1
+            else:
+                skipped += 1
+        if open_short:
+            if n_short < short_entry.shape[0]:
+                short_entry[n_short] = price
+                n_short += 1
+                short_sum += price
+                short_max = max(short_max, price)
+                realized -= fee
+                trades += 1
+            else:
+                skipped += 1
+
+        # 检查并平仓获利订单，用最后一个持仓填补空位
+        if n_long > 0:
+            profit = (price - long_min) / long_min * 100 if percent else price - long_min
+            if profit >= long_profit:
+                long_min = np.inf
+                j = 0
+                while j < n_long:
+                    entry = long_entry[j]
+                    profit = (price - entry) / entry * 100 if percent else price - entry
+                    if profit >= long_profit:
+                        realized += (price - entry) * quantity - fee
+                        trades += 1
+                        long_sum -= entry
+                        n_long -= 1
+                        long_entry[j] = long_entry[n_long]
+                    else:
+                        long_min = min(long_min, entry)
+                        j += 1
+                if n_long == 0:
+                    long_sum = 0.0
+        if n_short > 0:
+            profit = (short_max - price) / short_max * 100 if percent else short_max - price
+            if profit >= short_profit:
+                short_max = -np.inf
+                j = 0
+                while j < n_short:
+                    entry = short_entry[j]
+                    profit = (entry - price) / entry * 100 if percent else entry - price
+                    if profit >= short_profit:
+                        realized += (entry - price) * quantity - fee
+                        trades += 1
+                        short_sum -= entry
+                        n_short -= 1
+                        short_entry[j] = short_entry[n_short]
+                    else:
+                        short_max = max(short_max, entry)
+                        j += 1
+                if n_short == 0:
+                    short_sum = 0.0
+
+        pnl[i] = realized + (n_long * price - long_sum + short_sum - n_short * price) * quantity
+
+    return realized, trades, n_long, n_short, skipped
+
+@njit(cache=True)
+def _range_grid_kernel(close, levels, per_grid_investment, investment,
+                       trade_bar, trade_level, trade_side, trade_price, trade_quantity):
+    """区间网格（GridBacktest）按收盘价成交的状态机，成交写入trade_*数组
+
+    Returns:
+        (成交笔数, 期末持仓, 期末现金)
+    """
+    position = 0.0
+    cash = investment
+    n = 0
+    for i in range(close.shape[0]):
+        price = close[i]
+        for k in range(levels.shape[0]):
+            level = levels[k]
+            # 买入信号
+            if price <= level and cash >= per_grid_investment:
+                quantity = per_grid_investment / price
+                position += quantity
+                cash -= per_grid_investment
+                side = 1
+            # 卖出信号
+            elif price >= level and position > 0:
+                quantity = min(position, per_grid_investment / price)
+                position -= quantity
+                cash += quantity * price
+                side = -1
+            else:
+                continue
+            trade_bar[n] = i
+            trade_level[n] = k
+            trade_side[n] = side
+            trade_price[n] = price
+            trade_quantity[n] = quantity
+            n += 1
+    return n, position, cash
+
+def simulate_threshold_grid(close, quantity, price_drop, price_rise, long_profit, short_profit,
+                            fee_rate=0.0004, percent=True, keep_both_sides=False, max_positions=10000):
+    """运行阈值网格模拟
+
+    Returns:
+        dict: pnl（每根K线的累计盈亏，含浮动盈亏）、realized、trades、
+            open_longs/open_shorts（期末未平仓的开仓价）、skipped
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    long_entry = np.empty(max_positions)
+    short_entry = np.empty(max_positions)
+    pnl = np.empty(close.shape[0])
+    if close.shape[0] == 0:
+        return {'pnl': pnl, 'realized': 0.0, 'trades': 0,
+                'open_longs': long_entry[:0], 'open_shorts': short_entry[:0], 'skipped': 0}
+
+    realized, trades, n_long, n_short, skipped = _threshold_grid_kernel(
+        close, float(quantity), float(price_drop), float(price_rise), float(long_profit),
+        float(short_profit), float(fee_rate), percent, keep_both_sides, long_entry, short_entry, pnl
+    )
+    return {
+        'pnl': pnl,
+        'realized': realized,
+        'trades': trades,
+        'open_longs': long_entry[:n_long].copy(),
+        'open_shorts': short_entry[:n_short].copy(),
+        'skipped': skipped
+    }
+
+def simulate_range_grid(close, levels, per_grid_investment, investment):
+    """运行区间网格按收盘价成交的模拟
+
+    Returns:
+        dict: bar、level、side、price、quantity成交数组，以及期末position、cash
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    levels = np.ascontiguousarray(levels, dtype=np.float64)
+    capacity = close.shape[0] * levels.shape[0]
+    trade_bar = np.empty(capacity, dtype=np.int64)
+    trade_level = np.empty(capacity, dtype=np.int64)
+    trade_side = np.empty(capacity, dtype=np.int8)
+    trade_price = np.empty(capacity)
+    trade_quantity = np.empty(capacity)
+    n, position, cash = _range_grid_kernel(
+        close, levels, float(per_grid_investment), float(investment),
+        trade_bar, trade_level, trade_side, trade_price, trade_quantity
+    )
+    return {
+        'bar': trade_bar[:n],
+        'level': trade_level[:n],
+        'side': trade_side[:n],
+        'price': trade_price[:n],
+        'quantity': trade_quantity[:n],
+        'position': position,
+        'cash': cash
+    }
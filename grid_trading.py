@@ -1,23 +1,132 @@
-import ccxt
 from loguru import logger
+from circuit_breaker import get_breaker, CircuitOpenError
+from exchange_adapter import create_exchange
+from market_rules import get_symbol_rules
+from positions import Position
+from profiler import profiler
+from risk_engine import get_risk_engine, size_order
+from state_journal import StateJournal
 import time
+import os
 
 class GridTrading:
-    def __init__(self, symbol, api_key, api_secret, quantity):
+    def __init__(self, symbol, api_key, api_secret, quantity, state_dir=None):
         self.symbol = symbol
-        self.exchange = ccxt.binance({
-            'apiKey': api_key,
-            'secret': api_secret,
-            'enableRateLimit': True
-        })
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self._exchange = None
         self.quantity = quantity
         self.last_price = None
+        self.mark_price = None
         self.grid_orders = []
 
+        # 可选的指标存储（timeseries_store），记录价格和盈亏供看板展示
+        self.metrics = None
+
+        # 可选的本地订单簿，同步时用微观价格触发网格并按盘口深度限制下单数量
+        self.order_book = None
+        self.depth_stream = None
+        self.max_slippage_bps = float(os.getenv('ORDER_BOOK_MAX_SLIPPAGE_BPS', 10))
+
+        # 行情和下单接口分别熔断，失败的交易对不会拖慢其他交易对
+        self.ticker_breaker = get_breaker(f"{symbol}:ticker")
+        self.order_breaker = get_breaker(f"{symbol}:order")
+
+        # 持久化网格订单和参考价格，重启后从状态日志恢复
+        self.journal = None
+        if state_dir:
+            self.journal = StateJournal(os.path.join(state_dir, symbol.replace('/', '_')))
+            orders, self.last_price = self.journal.load()
+            self.grid_orders = [Position.from_dict(order) for order in orders]
+            if self.grid_orders or self.last_price:
+                logger.info(f"{self.symbol}恢复状态：{len(self.grid_orders)}个网格订单，参考价格{self.last_price}")
+
+        # 所有交易对共享的组合风险引擎，恢复的订单计入敞口
+        self.risk = get_risk_engine()
+        for position in self.grid_orders:
+            self.risk.on_fill(self.symbol, position.side, position.quantity, position.entry_price)
+
+    @property
+    def exchange(self):
+        """交易所实例，首次使用时才创建，相同API密钥的交易对共享同一实例"""
+        if self._exchange is None:
+            self._exchange = create_exchange(config={
+                'apiKey': self.api_key,
+                'secret': self.api_secret,
+                'enableRateLimit': True
+            })
+        return self._exchange
+
+    @property
+    def rules(self):
+        """交易对的下单过滤规则"""
+        return get_symbol_rules(self.exchange, self.symbol)
+
+    def set_last_price(self, price):
+        """更新网格参考价格"""
+        self.last_price = price
+        if self.journal:
+            with profiler.phase('db'):
+                self.journal.record_last_price(price)
+
+    def add_grid_order(self, side, price, quantity, order):
+        """记录新开的网格订单，不保存交易所返回的完整订单信息"""
+        position = Position.from_order(self.symbol, side, quantity, price, order)
+        self.grid_orders.append(position)
+        self.risk.on_fill(self.symbol, side, quantity, price)
+        if self.journal:
+            with profiler.phase('db'):
+                self.journal.record_open(position.to_dict())
+
+    def attach_order_book(self, book, stream=None):
+        """使用本地维护的订单簿（见order_book.start_binance_depth_stream）"""
+        self.order_book = book
+        self.depth_stream = stream
+
+    def order_fee(self, order, price):
+        """订单手续费折算为USDT，按基础币种收取时按成交价折算，其他币种（如BNB抵扣）不计入"""
+        fee = order.get('fee') or {}
+        cost = fee.get('cost') or 0
+        base, quote = self.symbol.split('/')
+        if fee.get('currency') == base:
+            return cost * price
+        if fee.get('currency') in (quote, None):
+            return cost
+        return 0
+
+    def on_grid_order_closed(self, position, price, fee=0):
+        """网格订单平仓后更新风险敞口、状态日志和已实现盈亏
+
+        已实现盈亏与ETH网格相同，按平仓盈亏减去平仓手续费记录。
+        """
+        self.risk.on_fill(self.symbol, position.side, -position.quantity, price)
+        if self.journal:
+            with profiler.phase('db'):
+                self.journal.record_close(position.id)
+        if self.metrics is not None:
+            self.metrics.record(f"realized:{self.symbol}", position.profit(price) - fee,
+                                self.exchange.milliseconds() / 1000)
+
+    def record_metrics(self):
+        """记录最新价格和网格订单的浮动盈亏"""
+        if self.mark_price is None:
+            return
+        timestamp = self.exchange.milliseconds() / 1000
+        self.metrics.record(f"price:{self.symbol}", self.mark_price, timestamp)
+        unrealized = sum(position.profit(self.mark_price) for position in self.grid_orders)
+        self.metrics.record_source(f"unrealized:{self.symbol}", unrealized, timestamp)
+
+    def available(self):
+        """行情接口未熔断时才需要运行"""
+        return self.ticker_breaker.available()
+
     def get_current_price(self):
         """获取当前价格"""
         try:
-            ticker = self.exchange.fetch_ticker(self.symbol)
+            if self.order_book is not None and self.order_book.is_fresh():
+                return self.order_book.microprice()
+            with profiler.phase('price_fetch'):
+                ticker = self.ticker_breaker.call(self.exchange.fetch_ticker, self.symbol)
             return ticker['last']
         except Exception as e:
             logger.error(f"获取{self.symbol}价格失败：{str(e)}")
@@ -27,41 +136,46 @@ class GridTrading:
         """放置网格订单"""
         try:
             current_price = self.get_current_price()
+            self.risk.on_mark(self.symbol, current_price)
+            self.mark_price = current_price
             if not self.last_price:
-                self.last_price = current_price
+                self.set_last_price(current_price)
                 return
 
             price_change = ((current_price - self.last_price) / self.last_price) * 100
+            if price_change > -self.price_drop and price_change < self.price_rise:
+                return
+
+            # 不满足盘口深度、风险限额或交易所规则的订单不发送
+            side = 'long' if price_change <= -self.price_drop else 'short'
+            quantity = size_order(self.order_book, self.risk, self.rules, self.symbol, side,
+                                  self.quantity, current_price, self.max_slippage_bps)
+            if quantity is None:
+                return
 
             # 价格下跌超过阈值，开多单
             if price_change <= -self.price_drop:
-                order = self.exchange.create_market_buy_order(
-                    self.symbol,
-                    self.quantity
-                )
+                with profiler.phase('order'):
+                    order = self.order_breaker.call(
+                        self.exchange.create_market_buy_order,
+                        self.symbol,
+                        quantity
+                    )
                 logger.info(f"价格下跌{abs(price_change):.2f}%，开多单：{order}")
-                self.grid_orders.append({
-                    'type': 'long',
-                    'price': current_price,
-                    'quantity': self.quantity,
-                    'order': order
-                })
-                self.last_price = current_price
+                self.add_grid_order('long', current_price, quantity, order)
+                self.set_last_price(current_price)
 
             # 价格上涨超过阈值，开空单
             elif price_change >= self.price_rise:
-                order = self.exchange.create_market_sell_order(
-                    self.symbol,
-                    self.quantity
-                )
+                with profiler.phase('order'):
+                    order = self.order_breaker.call(
+                        self.exchange.create_market_sell_order,
+                        self.symbol,
+                        quantity
+                    )
                 logger.info(f"价格上涨{price_change:.2f}%，开空单：{order}")
-                self.grid_orders.append({
-                    'type': 'short',
-                    'price': current_price,
-                    'quantity': self.quantity,
-                    'order': order
-                })
-                self.last_price = current_price
+                self.add_grid_order('short', current_price, quantity, order)
+                self.set_last_price(current_price)
 
         except Exception as e:
             logger.error(f"放置网格订单失败：{str(e)}")
@@ -71,35 +185,34 @@ class GridTrading:
         """检查并平仓获利订单"""
         try:
             current_price = self.get_current_price()
-            orders_to_remove = []
 
-            for i, order in enumerate(self.grid_orders):
-                entry_price = order['price']
-                profit = 0
+            # 遍历副本，平仓成交后立即移除，后续订单出错时已平仓的订单不会被重复平仓
+            for position in list(self.grid_orders):
+                profit = position.profit_percent(current_price)
 
-                if order['type'] == 'long':
-                    profit = ((current_price - entry_price) / entry_price) * 100
+                if position.side == 'long':
                     if profit >= self.long_profit:
-                        close_order = self.exchange.create_market_sell_order(
-                            self.symbol,
-                            order['quantity']
-                        )
+                        with profiler.phase('order'):
+                            close_order = self.order_breaker.call(
+                                self.exchange.create_market_sell_order,
+                                self.symbol,
+                                position.quantity
+                            )
                         logger.info(f"多单获利{profit:.2f}%，平仓：{close_order}")
-                        orders_to_remove.append(i)
+                        self.grid_orders.remove(position)
+                        self.on_grid_order_closed(position, current_price, self.order_fee(close_order, current_price))
 
-                elif order['type'] == 'short':
-                    profit = ((entry_price - current_price) / entry_price) * 100
+                elif position.side == 'short':
                     if profit >= self.short_profit:
-                        close_order = self.exchange.create_market_buy_order(
-                            self.symbol,
-                            order['quantity']
-                        )
+                        with profiler.phase('order'):
+                            close_order = self.order_breaker.call(
+                                self.exchange.create_market_buy_order,
+                                self.symbol,
+                                position.quantity
+                            )
                         logger.info(f"空单获利{profit:.2f}%，平仓：{close_order}")
-                        orders_to_remove.append(i)
-
-            # 从后往前移除已平仓的订单
-            for i in sorted(orders_to_remove, reverse=True):
-                self.grid_orders.pop(i)
+                        self.grid_orders.remove(position)
+                        self.on_grid_order_closed(position, current_price, self.order_fee(close_order, current_price))
 
         except Exception as e:
             logger.error(f"检查和平仓订单失败：{str(e)}")
@@ -110,6 +223,10 @@ class GridTrading:
         try:
             self.place_grid_orders()
             self.check_and_close_positions()
+            if self.metrics is not None:
+                self.record_metrics()
+        except CircuitOpenError as e:
+            logger.warning(f"{self.symbol}跳过本轮：{str(e)}")
         except Exception as e:
             logger.error(f"网格交易运行失败：{str(e)}")
             raise
\ No newline at end of file
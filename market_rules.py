@@ -0,0 +1,170 @@
+from decimal import Decimal
+
+# ccxt的精度模式：DECIMAL_PLACES表示小数位数，TICK_SIZE表示最小变动单位
+DECIMAL_PLACES = 2
+TICK_SIZE = 4
+
+class OrderValidationError(ValueError):
+    """订单不满足交易所的数量/价格/名义价值过滤规则"""
+
+class _Step:
+    """以整数刻度表示的最小变动单位，例如0.001表示为units=1, scale=1000"""
+
+    __slots__ = ('units', 'scale')
+
+    def __init__(self, step):
+        step = _decimal(step)
+        if not step or step <= 0:
+            self.units = 0
+            self.scale = 1
+            return
+        exponent = -step.normalize().as_tuple().exponent
+        self.scale = 10 ** max(exponent, 0)
+        self.units = int(step * self.scale)
+
+    def ticks(self, value):
+        """将数值转换为整数刻度（scale为单位）"""
+        return _decimal(value) * self.scale
+
+    def floor(self, value):
+        if not self.units:
+            return float(value)
+        units = int(self.ticks(value))
+        return (units - units % self.units) / self.scale
+
+    def nearest(self, value):
+        if not self.units:
+            return float(value)
+        units = int(self.ticks(value) + Decimal(self.units) / 2)
+        return (units - units % self.units) / self.scale
+
+def _decimal(value):
+    if value is None:
+        return None
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+def _float(value):
+    return float(value) if value is not None else 0.0
+
+class SymbolRules:
+    """单个交易对的市价单过滤规则（MARKET_LOT_SIZE / LOT_SIZE / PRICE_FILTER / MIN_NOTIONAL）"""
+
+    __slots__ = ('symbol', 'amount_step', 'price_step', 'min_amount', 'max_amount',
+                 'min_price', 'max_price', 'min_notional')
+
+    def __init__(self, symbol, amount_step, price_step, min_amount=0, max_amount=0,
+                 min_price=0, max_price=0, min_notional=0):
+        self.symbol = symbol
+        self.amount_step = _Step(amount_step)
+        self.price_step = _Step(price_step)
+        self.min_amount = _float(min_amount)
+        self.max_amount = _float(max_amount)
+        self.min_price = _float(min_price)
+        self.max_price = _float(max_price)
+        self.min_notional = _float(min_notional)
+
+    @classmethod
+    def from_market(cls, market, precision_mode=TICK_SIZE):
+        """从ccxt的market结构构建，优先使用币安原始过滤器
+
+        本项目只下市价单，币安对市价单按MARKET_LOT_SIZE校验数量（合约的maxQty远小于
+        LOT_SIZE），因此数量步长和上下限优先取MARKET_LOT_SIZE，值为0（未设置）时
+        退回LOT_SIZE。
+        """
+        filters = {f.get('filterType'): f for f in market.get('info', {}).get('filters', [])}
+        lot = filters.get('LOT_SIZE')
+        market_lot = filters.get('MARKET_LOT_SIZE') or {}
+        price = filters.get('PRICE_FILTER')
+        notional = filters.get('MIN_NOTIONAL') or filters.get('NOTIONAL')
+        if lot and price:
+            min_notional = 0
+            if notional:
+                min_notional = notional.get('minNotional', notional.get('notional', 0))
+
+            def lot_value(key):
+                value = market_lot.get(key)
+                return value if _decimal(value) else lot.get(key)
+
+            return cls(
+                market['symbol'],
+                amount_step=lot_value('stepSize'),
+                price_step=price['tickSize'],
+                min_amount=lot_value('minQty'),
+                max_amount=lot_value('maxQty'),
+                min_price=price.get('minPrice'),
+                max_price=price.get('maxPrice'),
+                min_notional=min_notional
+            )
+
+        precision = market.get('precision', {})
+        limits = market.get('limits', {})
+        amount_step = precision.get('amount')
+        price_step = precision.get('price')
+        if precision_mode == DECIMAL_PLACES:
+            amount_step = Decimal(1).scaleb(-int(amount_step)) if amount_step is not None else None
+            price_step = Decimal(1).scaleb(-int(price_step)) if price_step is not None else None
+        return cls(
+            market['symbol'],
+            amount_step=amount_step,
+            price_step=price_step,
+            min_amount=limits.get('amount', {}).get('min'),
+            max_amount=limits.get('amount', {}).get('max'),
+            min_price=limits.get('price', {}).get('min'),
+            max_price=limits.get('price', {}).get('max'),
+            min_notional=limits.get('cost', {}).get('min')
+        )
+
+    def round_amount(self, amount):
+        """数量按步长向下取整"""
+        return self.amount_step.floor(amount)
+
+    def round_price(self, price):
+        """价格按最小变动价位四舍五入"""
+        return self.price_step.nearest(price)
+
+    def validate(self, amount, price):
+        """本地校验订单，不满足规则时抛出OrderValidationError"""
+        if amount <= 0:
+            raise OrderValidationError(f"{self.symbol}下单数量按步长取整后为0")
+        if self.min_amount and amount < self.min_amount:
+            raise OrderValidationError(f"{self.symbol}下单数量{amount}小于最小数量{self.min_amount}")
+        if self.max_amount and amount > self.max_amount:
+            raise OrderValidationError(f"{self.symbol}下单数量{amount}大于最大数量{self.max_amount}")
+        if price is not None:
+            if self.min_price and price < self.min_price:
+                raise OrderValidationError(f"{self.symbol}价格{price}小于最低价格{self.min_price}")
+            if self.max_price and price > self.max_price:
+                raise OrderValidationError(f"{self.symbol}价格{price}大于最高价格{self.max_price}")
+            if self.min_notional and amount * price < self.min_notional:
+                raise OrderValidationError(
+                    f"{self.symbol}订单名义价值{amount * price:.8f}小于最小名义价值{self.min_notional}"
+                )
+
+    def prepare_order(self, amount, price=None):
+        """取整并校验订单，返回可直接提交的数量（和取整后的价格）
+
+        Args:
+            amount: 下单数量，可以是float或MySQL返回的Decimal
+            price: 限价单价格，市价单传入参考价格用于校验名义价值
+        """
+        amount = self.round_amount(amount)
+        if price is not None:
+            price = self.round_price(price)
+        self.validate(amount, price)
+        return amount, price
+
+# 进程内缓存的交易对规则
+_rules = {}
+
+def get_symbol_rules(exchange, symbol):
+    """获取交易对的下单规则，每个交易对只解析一次市场信息"""
+    market_type = exchange.options.get('defaultType', 'spot')
+    key = (exchange.id, market_type, symbol)
+    rules = _rules.get(key)
+    if rules is None:
+        market = exchange.market(symbol)
+        rules = SymbolRules.from_market(market, getattr(exchange, 'precisionMode', TICK_SIZE))
+        _rules[key] = rules
+    return rules
@@ -0,0 +1,391 @@
+from loguru import logger
+from bisect import bisect_left, bisect_right
+import json
+import threading
+import time
+
+class OrderBookGapError(Exception):
+    """差量深度更新不连续，本地订单簿需要重新同步快照"""
+
+def _snapshot_id(snapshot):
+    """快照的更新ID，兼容币安REST（lastUpdateId）和ccxt（nonce）格式"""
+    return int(snapshot['lastUpdateId'] if 'lastUpdateId' in snapshot else snapshot['nonce'])
+
+class BookSide:
+    """订单簿的一侧
+
+    价格按升序保存在keys中（买盘保存负价格，使两侧的最优价都在下标0），
+    数量保存在平行的sizes列表中，按价格更新时二分查找定位档位。
+    """
+
+    def __init__(self, is_bid):
+        self.is_bid = is_bid
+        self.keys = []
+        self.sizes = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def clear(self):
+        self.keys = []
+        self.sizes = []
+
+    def update(self, price, size):
+        """更新一个价位的挂单数量，数量为0时删除该价位"""
+        key = -price if self.is_bid else price
+        i = bisect_left(self.keys, key)
+        found = i < len(self.keys) and self.keys[i] == key
+        if size == 0:
+            if found:
+                del self.keys[i]
+                del self.sizes[i]
+        elif found:
+            self.sizes[i] = size
+        else:
+            self.keys.insert(i, key)
+            self.sizes.insert(i, size)
+
+    def best(self):
+        """最优价和数量，没有挂单时返回None"""
+        if not self.keys:
+            return None
+        return (-self.keys[0] if self.is_bid else self.keys[0]), self.sizes[0]
+
+    def levels(self, n=None):
+        """从最优价开始的(价格, 数量)列表"""
+        keys = self.keys[:n] if n else self.keys
+        if self.is_bid:
+            return [(-key, size) for key, size in zip(keys, self.sizes)]
+        return list(zip(keys, self.sizes))
+
+class LocalOrderBook:
+    """本地维护的L2订单簿
+
+    由REST快照初始化，再按币安差量深度流（depthUpdate）增量更新。更新ID按币安
+    规则检查连续性：快照后的第一条更新需满足U <= lastUpdateId + 1 <= u，之后现货
+    要求U等于上一条的u + 1，合约要求pu等于上一条的u；不连续时抛出
+    OrderBookGapError并标记为未同步，在重新加载快照前收到的更新先缓存。
+
+    实盘时行情线程写入、交易线程读取，两侧的价格和数量列表需要一起修改，
+    因此所有读写都持有同一把锁，读到的价格和数量总是来自同一次更新之后的状态。
+
+    Args:
+        symbol (str): 交易对
+        max_buffer (int): 未同步时最多缓存的更新条数
+    """
+
+    def __init__(self, symbol, max_buffer=10000):
+        self.symbol = symbol
+        self.max_buffer = max_buffer
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.last_update_id = None
+        self.synced = False
+        self.bridged = False  # 快照后是否已应用过一条更新
+        self.buffer = []
+        self.updated_at = None
+        self.event_time = None  # 最近一条更新的交易所事件时间（毫秒）
+        self.lock = threading.RLock()
+
+    def load_snapshot(self, snapshot):
+        """加载快照（币安REST的lastUpdateId格式或ccxt的nonce格式），并应用缓存的更新"""
+        with self.lock:
+            self.bids.clear()
+            self.asks.clear()
+            for price, size in snapshot['bids']:
+                self.bids.update(float(price), float(size))
+            for price, size in snapshot['asks']:
+                self.asks.update(float(price), float(size))
+            self.last_update_id = _snapshot_id(snapshot)
+            self.synced = True
+            self.bridged = False
+            self.updated_at = time.time()
+
+            buffered, self.buffer = self.buffer, []
+            for event in buffered:
+                self.apply_event(event)
+
+    def invalidate(self):
+        with self.lock:
+            self.synced = False
+            self.buffer = []
+
+    def apply_event(self, event):
+        """应用一条差量深度更新
+
+        Returns:
+            bool: 是否已应用（未同步时缓存、过期的更新丢弃时返回False）
+        """
+        with self.lock:
+            if not self.synced:
+                if len(self.buffer) < self.max_buffer:
+                    self.buffer.append(event)
+                return False
+
+            first_id, final_id = event['U'], event['u']
+            if final_id <= self.last_update_id:
+                return False
+
+            if not self.bridged:
+                gap = first_id > self.last_update_id + 1
+            elif 'pu' in event:
+                gap = event['pu'] != self.last_update_id
+            else:
+                gap = first_id != self.last_update_id + 1
+            if gap:
+                last_update_id = self.last_update_id
+                self.invalidate()
+                raise OrderBookGapError(
+                    f"{self.symbol}深度更新不连续：本地{last_update_id}，收到U={first_id} u={final_id}"
+                )
+
+            for price, size in event['b']:
+                self.bids.update(float(price), float(size))
+            for price, size in event['a']:
+                self.asks.update(float(price), float(size))
+            self.last_update_id = final_id
+            self.bridged = True
+            self.updated_at = time.time()
+            self.event_time = event.get('E', self.event_time)
+            return True
+
+    def is_fresh(self, max_age=5):
+        """已同步且最近max_age秒内有更新"""
+        return self.synced and self.updated_at is not None and time.time() - self.updated_at <= max_age
+
+    def best_bid(self):
+        with self.lock:
+            best = self.bids.best()
+            return best[0] if best else None
+
+    def best_ask(self):
+        with self.lock:
+            best = self.asks.best()
+            return best[0] if best else None
+
+    def mid(self):
+        """中间价"""
+        with self.lock:
+            bid, ask = self.bids.best(), self.asks.best()
+            if not bid or not ask:
+                return None
+            return (bid[0] + ask[0]) / 2
+
+    def spread_bps(self):
+        """买卖价差（基点）"""
+        with self.lock:
+            mid = self.mid()
+            if mid is None:
+                return None
+            return (self.best_ask() - self.best_bid()) / mid * 10000
+
+    def microprice(self):
+        """按最优档数量加权的微观价格，买盘越厚越接近卖一价"""
+        with self.lock:
+            bid, ask = self.bids.best(), self.asks.best()
+            if not bid or not ask:
+                return None
+            return (bid[0] * ask[1] + ask[0] * bid[1]) / (bid[1] + ask[1])
+
+    def _side(self, side):
+        """买单吃卖盘，卖单吃买盘"""
+        return self.asks if side == 'buy' else self.bids
+
+    def available_amount(self, side, max_slippage_bps):
+        """市价单在最差成交价不偏离最优价max_slippage_bps时可成交的数量
+
+        Args:
+            side (str): 'buy'或'sell'
+            max_slippage_bps (float): 允许的滑点（基点）
+        """
+        with self.lock:
+            book = self._side(side)
+            best = book.best()
+            if not best:
+                return 0.0
+            if side == 'buy':
+                end = bisect_right(book.keys, best[0] * (1 + max_slippage_bps / 10000))
+            else:
+                end = bisect_right(book.keys, -best[0] * (1 - max_slippage_bps / 10000))
+            return sum(book.sizes[:end])
+
+    def vwap(self, side, amount):
+        """市价单成交amount的平均成交价，盘口深度不足时返回None"""
+        with self.lock:
+            remaining = amount
+            cost = 0.0
+            for price, size in self._side(side).levels():
+                fill = min(size, remaining)
+                cost += fill * price
+                remaining -= fill
+                if remaining <= 0:
+                    return cost / amount
+            return None
+
+class DepthSync:
+    """差量深度流与快照的同步
+
+    收到更新时应用到本地订单簿，未同步或更新不连续时通知同步线程调用fetch_snapshot
+    重新加载快照。快照请求是阻塞的REST调用，不在行情回调中执行，期间收到的更新由
+    订单簿缓存，快照加载后继续应用。实盘时由行情线程调用on_event，回放时由
+    replay_depth_file驱动。
+
+    Args:
+        book (LocalOrderBook): 本地订单簿
+        fetch_snapshot (callable): 获取快照的函数
+        recorder (DepthRecorder): 可选，同时记录快照和更新用于回放
+        retry_delay (float): 快照获取失败后的重试间隔（秒）
+    """
+
+    def __init__(self, book, fetch_snapshot, recorder=None, retry_delay=1.0):
+        self.book = book
+        self.fetch_snapshot = fetch_snapshot
+        self.recorder = recorder
+        self.retry_delay = retry_delay
+        self.resyncs = 0
+        self.resync_needed = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """启动快照同步线程，并请求首次快照"""
+        self.thread = threading.Thread(
+            target=self._run, name=f"depth-sync-{self.book.symbol}", daemon=True
+        )
+        self.thread.start()
+        self.resync_needed.set()
+
+    def stop(self):
+        self.stop_event.set()
+        self.resync_needed.set()
+
+    def resync(self):
+        snapshot = self.fetch_snapshot()
+        if self.recorder:
+            self.recorder.record_snapshot(snapshot)
+        self.book.load_snapshot(snapshot)
+        self.resyncs += 1
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.resync_needed.wait()
+            self.resync_needed.clear()
+            if self.stop_event.is_set() or self.book.synced:
+                continue
+            try:
+                self.resync()
+            except Exception as e:
+                logger.error(f"{self.book.symbol}订单簿快照同步失败：{str(e)}")
+                self.stop_event.wait(self.retry_delay)
+                self.resync_needed.set()
+
+    def on_event(self, event):
+        if self.recorder:
+            self.recorder.record_event(event)
+        try:
+            self.book.apply_event(event)
+        except OrderBookGapError as e:
+            logger.warning(f"{str(e)}，重新同步快照")
+            self.book.apply_event(event)  # 未同步状态下缓存
+        if not self.book.synced:
+            self.resync_needed.set()
+
+class DepthRecorder:
+    """将快照和差量更新按行写入JSON文件，用于回放测试
+
+    快照统一记为币安REST格式（含lastUpdateId），更新保存原始depthUpdate消息。
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+        self.lock = threading.Lock()  # 快照和更新分别由同步线程和行情线程写入
+
+    def record_snapshot(self, snapshot):
+        self._write({
+            'lastUpdateId': _snapshot_id(snapshot),
+            'bids': snapshot['bids'],
+            'asks': snapshot['asks']
+        })
+
+    def record_event(self, event):
+        self._write(event)
+
+    def _write(self, record):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def replay_depth_file(path, book):
+    """按记录文件回放深度数据
+
+    文件中带lastUpdateId的行为快照，其余为差量更新；更新不连续时等待文件中的
+    下一个快照重新同步。
+
+    Yields:
+        LocalOrderBook: 每条更新应用后的订单簿
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'lastUpdateId' in record:
+                book.load_snapshot(record)
+                continue
+            try:
+                applied = book.apply_event(record)
+            except OrderBookGapError as e:
+                logger.warning(f"{str(e)}，等待下一个快照")
+                book.apply_event(record)
+                continue
+            if applied:
+                yield book
+
+def start_binance_depth_stream(exchange, symbol, futures=False, limit=1000, record_path=None):
+    """订阅币安差量深度流并维护本地订单簿
+
+    使用python-binance的ThreadedWebsocketManager接收100ms差量更新，
+    快照由DepthSync的同步线程通过ccxt的fetch_order_book获取。
+
+    Returns:
+        (LocalOrderBook, ThreadedWebsocketManager): 停止时调用manager.stop()
+    """
+    from binance import ThreadedWebsocketManager
+
+    book = LocalOrderBook(symbol)
+    recorder = DepthRecorder(record_path) if record_path else None
+    sync = DepthSync(book, lambda: exchange.fetch_order_book(symbol, limit=limit), recorder)
+    sync.start()
+
+    def handle_message(message):
+        data = message.get('data', message)
+        if data.get('e') == 'depthUpdate':
+            sync.on_event(data)
+
+    stream = f"{exchange.market(symbol)['id'].lower()}@depth@100ms"
+    manager = ThreadedWebsocketManager()
+    manager.start()
+    if futures:
+        manager.start_futures_multiplex_socket(callback=handle_message, streams=[stream])
+    else:
+        manager.start_multiplex_socket(callback=handle_message, streams=[stream])
+    logger.info(f"{symbol}订阅差量深度流：{stream}")
+    return book, manager
+
+def cap_amount_by_depth(book, side, amount, max_slippage_bps):
+    """按盘口深度限制市价单数量，订单簿未同步或已过期时不限制
+
+    Returns:
+        float: 不超过max_slippage_bps滑点可成交的数量与amount中的较小值
+    """
+    if book is None or not book.is_fresh():
+        return amount
+    available = book.available_amount(side, max_slippage_bps)
+    if available < amount:
+        logger.warning(f"{book.symbol}盘口深度不足：{max_slippage_bps}基点内可成交{available}，下单数量由{amount}减少")
+        return available
+    return amount
@@ -0,0 +1,92 @@
+from datetime import datetime
+
+class Position:
+    """持仓
+
+    策略、数据库映射和回测共用的持仓表示。使用__slots__且只保留必要字段，
+    开仓成交后不再保存交易所返回的完整订单信息。
+    """
+
+    __slots__ = ('id', 'symbol', 'side', 'quantity', 'entry_price', 'order_id', 'status', 'opened_at')
+
+    def __init__(self, symbol, side, quantity, entry_price, id=None, order_id=None,
+                 status='open', opened_at=None):
+        self.id = id
+        self.symbol = symbol
+        self.side = side  # 'long' 或 'short'
+        self.quantity = float(quantity)
+        self.entry_price = float(entry_price)
+        self.order_id = order_id
+        self.status = status
+        self.opened_at = opened_at
+
+    @classmethod
+    def from_order(cls, symbol, side, quantity, price, order):
+        """由交易所下单结果创建持仓，只保留订单ID"""
+        return cls(symbol, side, quantity, price, id=order['id'], order_id=order['id'],
+                   opened_at=datetime.now())
+
+    @classmethod
+    def from_row(cls, row):
+        """由positions表的一行（DictCursor）创建持仓，DECIMAL字段转换为float"""
+        return cls(
+            row['symbol'],
+            row['position_type'],
+            row['quantity'],
+            row['entry_price'],
+            id=row['id'],
+            status=row['status'],
+            opened_at=row.get('created_at')
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """由to_dict的结果（状态日志中的记录）创建持仓"""
+        opened_at = data.get('opened_at')
+        return cls(
+            data['symbol'],
+            data['side'],
+            data['quantity'],
+            data['entry_price'],
+            id=data.get('id'),
+            order_id=data.get('order_id'),
+            status=data.get('status', 'open'),
+            opened_at=datetime.fromisoformat(opened_at) if opened_at else None
+        )
+
+    def to_dict(self):
+        """转换为可JSON序列化的字典"""
+        return {
+            'id': self.id,
+            'symbol': self.symbol,
+            'side': self.side,
+            'quantity': self.quantity,
+            'entry_price': self.entry_price,
+            'order_id': self.order_id,
+            'status': self.status,
+            'opened_at': self.opened_at.isoformat() if self.opened_at else None
+        }
+
+    def profit(self, price):
+        """按价格计算的浮动盈亏"""
+        if self.side == 'long':
+            return (price - self.entry_price) * self.quantity
+        return (self.entry_price - price) * self.quantity
+
+    def profit_points(self, price):
+        """每单位的盈利价差"""
+        if self.side == 'long':
+            return price - self.entry_price
+        return self.entry_price - price
+
+    def profit_percent(self, price):
+        """盈利百分比"""
+        return self.profit_points(price) / self.entry_price * 100
+
+    def __repr__(self):
+        return (f"Position(id={self.id!r}, symbol={self.symbol!r}, side={self.side!r}, "
+                f"quantity={self.quantity}, entry_price={self.entry_price}, status={self.status!r})")
+
+def positions_from_arrays(symbol, side, entry_prices, quantity):
+    """将回测内核输出的开仓价数组转换为持仓列表"""
+    return [Position(symbol, side, quantity, price) for price in entry_prices.tolist()]
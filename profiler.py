@@ -0,0 +1,204 @@
+from loguru import logger
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+class _NullPhase:
+    """采样器关闭时phase()返回的空上下文"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_PHASE = _NullPhase()
+
+class _Phase:
+    __slots__ = ('profiler', 'name', 'thread_id', 'previous')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.thread_id = threading.get_ident()
+        phases = self.profiler.phases
+        self.previous = phases.get(self.thread_id)
+        phases[self.thread_id] = self.name
+        return self
+
+    def __exit__(self, *exc):
+        if self.previous is None:
+            self.profiler.phases.pop(self.thread_id, None)
+        else:
+            self.profiler.phases[self.thread_id] = self.previous
+        return False
+
+class LoopProfiler:
+    """交易主循环的采样分析器
+
+    开启后由后台线程按interval对所有线程的调用栈采样，栈底加上当前所处的阶段
+    （价格获取、下单、数据库、日志等），每flush_interval秒将采样结果以折叠栈格式
+    （可直接用flamegraph.pl或speedscope打开）写入output_dir；开启内存追踪时同时保存
+    tracemalloc快照。关闭时不启动线程，phase()只做一次属性判断。
+
+    tracemalloc会拖慢每次内存分配，因此只在每次写盘前的memory_window秒内开启，
+    快照记录的是这段时间内分配且仍存活的内存。
+
+    Args:
+        output_dir (str): 输出目录
+        interval (float): 采样间隔（秒）
+        flush_interval (float): 写盘间隔（秒）
+        trace_memory (bool): 是否同时开启tracemalloc
+        memory_window (float): 每个写盘周期内开启tracemalloc的秒数
+    """
+
+    def __init__(self, output_dir='profiles', interval=0.01, flush_interval=60, trace_memory=False,
+                 memory_window=5):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.trace_memory = trace_memory
+        self.memory_window = memory_window
+        self.enabled = False
+        self.phases = {}  # 线程ID -> 当前阶段
+        self.samples = Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def phase(self, name):
+        """标记当前线程所处的循环阶段"""
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def start(self):
+        with self.lock:
+            if self.enabled:
+                return
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='loop-profiler', daemon=True)
+            self.enabled = True
+            self.thread.start()
+        logger.info(f"采样分析已开启，输出目录：{self.output_dir}")
+
+    def stop(self):
+        with self.lock:
+            if not self.enabled:
+                return
+            self.enabled = False
+            self.stop_event.set()
+            thread = self.thread
+            self.thread = None
+        thread.join()
+        self.flush()
+        self.phases.clear()
+        logger.info("采样分析已关闭")
+
+    def toggle(self):
+        if self.enabled:
+            self.stop()
+        else:
+            self.start()
+
+    def _frame_label(self, code):
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(self.phases.get(thread_id, 'other'))
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while not self.stop_event.wait(self.interval):
+            self._sample()
+            now = time.monotonic()
+            if self.trace_memory and now >= next_flush - self.memory_window and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if now >= next_flush:
+                self.flush()
+                next_flush = time.monotonic() + self.flush_interval
+
+    def flush(self):
+        """将采样结果和内存快照写入磁盘"""
+        samples, self.samples = self.samples, Counter()
+        timestamp = time.strftime('%Y%m%d_%H%M%S')
+        if samples:
+            path = os.path.join(self.output_dir, f"profile_{timestamp}.collapsed")
+            # 同一秒内多次写盘时追加，折叠栈格式允许重复的栈
+            with open(path, 'a', encoding='utf-8') as f:
+                for stack, count in samples.items():
+                    f.write(f"{stack} {count}\n")
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.take_snapshot().dump(os.path.join(self.output_dir, f"alloc_{timestamp}.tracemalloc"))
+            tracemalloc.stop()
+
+    def install_signal_handler(self, signum=getattr(signal, 'SIGUSR1', None)):
+        """收到信号时切换开关（kill -USR1 <pid>）"""
+        if signum is None:
+            return
+        # 信号处理函数中不能join线程，交给单独的线程执行
+        signal.signal(signum, lambda *_: threading.Thread(target=self.toggle, daemon=True).start())
+
+    def serve_http(self, port, host='127.0.0.1'):
+        """启动控制接口：GET /profiler/start、/profiler/stop、/profiler/status"""
+        profiler = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/profiler/start':
+                    profiler.start()
+                elif self.path == '/profiler/stop':
+                    profiler.stop()
+                elif self.path != '/profiler/status':
+                    self.send_error(404)
+                    return
+                body = ('on' if profiler.enabled else 'off').encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='profiler-http', daemon=True).start()
+        logger.info(f"采样分析控制接口：http://{host}:{port}/profiler/status")
+        return server
+
+# 进程内共享的分析器，按环境变量配置
+profiler = LoopProfiler(
+    output_dir=os.getenv('PROFILER_DIR', 'profiles'),
+    interval=float(os.getenv('PROFILER_INTERVAL', 0.01)),
+    flush_interval=float(os.getenv('PROFILER_FLUSH_INTERVAL', 60)),
+    trace_memory=os.getenv('PROFILER_TRACEMALLOC', '0') == '1',
+    memory_window=float(os.getenv('PROFILER_MEMORY_WINDOW', 5))
+)
+
+def setup_profiler():
+    """注册信号开关和HTTP控制接口，PROFILER_ENABLED=1时直接开启"""
+    profiler.install_signal_handler()
+    port = os.getenv('PROFILER_HTTP_PORT')
+    if port:
+        profiler.serve_http(int(port))
+    if os.getenv('PROFILER_ENABLED', '0') == '1':
+        profiler.start()
+    return profiler
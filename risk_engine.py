@@ -0,0 +1,196 @@
+from loguru import logger
+from market_rules import OrderValidationError
+from order_book import cap_amount_by_depth
+import os
+
+class RiskLimitError(Exception):
+    """订单会突破组合风险限额，且无法缩减到可接受的数量"""
+
+class RiskEngine:
+    """跨交易对的组合风险引擎
+
+    在内存中按交易对记录多空持仓数量和标记价格，并增量维护组合的多头名义价值、
+    空头名义价值和保证金占用估算。成交和价格更新只修改对应交易对的差额，
+    下单前检查只比较几个汇总值，不需要遍历持仓，也不访问交易所或数据库。
+
+    限额为0表示不限制。平仓订单只减少敞口，不需要检查。
+
+    Args:
+        max_total_notional (float): 组合多空名义价值之和上限（USDT）
+        max_side_notional (float): 单边（多头或空头）名义价值上限
+        max_symbol_notional (float): 单个交易对多空名义价值之和上限
+        max_margin (float): 保证金占用上限（USDT）
+        max_margin_ratio (float): 保证金占用不超过账户权益的比例，需通过update_equity更新权益
+        leverage (float): 估算保证金使用的杠杆倍数
+        resize (bool): 超限时是否把订单缩减到剩余额度，False时直接拒绝
+        min_notional (float): 缩减后名义价值低于该值时拒绝
+    """
+
+    def __init__(self, max_total_notional=0, max_side_notional=0, max_symbol_notional=0,
+                 max_margin=0, max_margin_ratio=0, leverage=1, resize=True, min_notional=0):
+        self.max_total_notional = max_total_notional
+        self.max_side_notional = max_side_notional
+        self.max_symbol_notional = max_symbol_notional
+        self.max_margin = max_margin
+        self.max_margin_ratio = max_margin_ratio
+        self.leverage = leverage
+        self.resize = resize
+        self.min_notional = min_notional
+        self.exposures = {}  # 交易对 -> [多单数量, 空单数量, 标记价格]
+        self.long_notional = 0.0
+        self.short_notional = 0.0
+        self.equity = None
+        self.rejected = 0
+        self.resized = 0
+
+    @classmethod
+    def from_env(cls):
+        """从环境变量读取限额（RISK_*）"""
+        return cls(
+            max_total_notional=float(os.getenv('RISK_MAX_TOTAL_NOTIONAL', 0)),
+            max_side_notional=float(os.getenv('RISK_MAX_SIDE_NOTIONAL', 0)),
+            max_symbol_notional=float(os.getenv('RISK_MAX_SYMBOL_NOTIONAL', 0)),
+            max_margin=float(os.getenv('RISK_MAX_MARGIN', 0)),
+            max_margin_ratio=float(os.getenv('RISK_MAX_MARGIN_RATIO', 0)),
+            leverage=float(os.getenv('RISK_LEVERAGE', 1)),
+            resize=os.getenv('RISK_RESIZE', '1') == '1',
+            min_notional=float(os.getenv('RISK_MIN_NOTIONAL', 0))
+        )
+
+    @property
+    def total_notional(self):
+        return self.long_notional + self.short_notional
+
+    @property
+    def margin(self):
+        """保证金占用估算：多空名义价值之和 / 杠杆"""
+        return self.total_notional / self.leverage
+
+    def _exposure(self, symbol, price):
+        exposure = self.exposures.get(symbol)
+        if exposure is None:
+            exposure = [0.0, 0.0, float(price)]
+            self.exposures[symbol] = exposure
+        return exposure
+
+    def update_equity(self, equity):
+        """更新账户权益（例如check_balance时），用于按比例限制保证金"""
+        self.equity = float(equity)
+
+    def on_mark(self, symbol, price):
+        """更新标记价格，按价差调整名义价值"""
+        exposure = self.exposures.get(symbol)
+        if exposure is None:
+            return
+        price = float(price)
+        change = price - exposure[2]
+        self.long_notional += exposure[0] * change
+        self.short_notional += exposure[1] * change
+        exposure[2] = price
+
+    def on_fill(self, symbol, side, quantity, price):
+        """记录成交，开仓传入正数量，平仓传入负数量
+
+        Args:
+            side (str): 'long'或'short'
+        """
+        quantity = float(quantity)
+        exposure = self._exposure(symbol, price)
+        self.on_mark(symbol, price)
+        if side == 'long':
+            quantity = max(quantity, -exposure[0])
+            exposure[0] += quantity
+            self.long_notional += quantity * exposure[2]
+        else:
+            quantity = max(quantity, -exposure[1])
+            exposure[1] += quantity
+            self.short_notional += quantity * exposure[2]
+
+    def headroom(self, symbol, side):
+        """指定交易对和方向还能新增的名义价值，不限制时为inf"""
+        room = float('inf')
+        if self.max_total_notional:
+            room = min(room, self.max_total_notional - self.total_notional)
+        if self.max_side_notional:
+            side_notional = self.long_notional if side == 'long' else self.short_notional
+            room = min(room, self.max_side_notional - side_notional)
+        if self.max_symbol_notional:
+            exposure = self.exposures.get(symbol)
+            used = (exposure[0] + exposure[1]) * exposure[2] if exposure else 0.0
+            room = min(room, self.max_symbol_notional - used)
+        max_margin = self.max_margin
+        if self.max_margin_ratio and self.equity is not None:
+            ratio_margin = self.equity * self.max_margin_ratio
+            max_margin = min(max_margin, ratio_margin) if max_margin else ratio_margin
+        if max_margin:
+            room = min(room, (max_margin - self.margin) * self.leverage)
+        return max(room, 0.0)
+
+    def check(self, symbol, side, quantity, price):
+        """开仓前检查，返回允许的数量
+
+        未超限时原样返回；超限且允许缩减时返回剩余额度对应的数量；
+        否则抛出RiskLimitError。
+
+        Args:
+            side (str): 'long'或'short'
+        """
+        quantity = float(quantity)
+        notional = quantity * price
+        room = self.headroom(symbol, side)
+        if notional <= room:
+            return quantity
+        if not self.resize or room <= 0 or room < self.min_notional:
+            self.rejected += 1
+            raise RiskLimitError(
+                f"{symbol}开{side}单{quantity}（{notional:.2f} USDT）超过风险限额，剩余额度{room:.2f} USDT"
+            )
+        self.resized += 1
+        allowed = room / price
+        logger.warning(f"{symbol}开{side}单数量由{quantity}缩减为{allowed}，剩余额度{room:.2f} USDT")
+        return allowed
+
+    def status(self):
+        """当前组合敞口"""
+        return {
+            'long_notional': self.long_notional,
+            'short_notional': self.short_notional,
+            'total_notional': self.total_notional,
+            'margin': self.margin,
+            'equity': self.equity,
+            'symbols': len(self.exposures),
+            'rejected': self.rejected,
+            'resized': self.resized
+        }
+
+# 进程内所有交易实例共享同一个风险引擎
+_engine = None
+
+def get_risk_engine():
+    """获取共享的风险引擎，首次调用时按环境变量创建"""
+    global _engine
+    if _engine is None:
+        _engine = RiskEngine.from_env()
+    return _engine
+
+def size_order(book, risk, rules, symbol, side, amount, price, max_slippage_bps):
+    """开仓前确定下单数量
+
+    依次按盘口深度和组合风险限额限制数量，再按交易所规则取整并校验。
+
+    Args:
+        side (str): 'long'或'short'
+
+    Returns:
+        float: 可以发送的数量；未通过风控或交易所规则校验时返回None
+    """
+    try:
+        amount = cap_amount_by_depth(book, 'buy' if side == 'long' else 'sell', amount, max_slippage_bps)
+        amount = risk.check(symbol, side, amount, price)
+        amount, _ = rules.prepare_order(amount, price)
+        return amount
+    except RiskLimitError as e:
+        logger.warning(f"订单未通过风控：{str(e)}")
+    except OrderValidationError as e:
+        logger.warning(f"订单未通过校验：{str(e)}")
+    return None
@@ -0,0 +1,112 @@
+from loguru import logger
+import json
+import os
+
+class StateJournal:
+    """网格订单状态日志
+
+    每次状态变更以一行紧凑的JSON追加到WAL文件并fsync，记录数达到
+    snapshot_every后写入快照并清空WAL。启动时先加载快照再重放WAL。
+    所有记录都是幂等的（按订单ID开仓/平仓、覆盖参考价），
+    因此快照替换后、WAL清空前崩溃也不会导致重复状态。
+    """
+
+    def __init__(self, path, snapshot_every=1000, fsync=True):
+        self.snapshot_path = f"{path}.snapshot"
+        self.wal_path = f"{path}.wal"
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.orders = {}  # 订单ID -> 网格订单
+        self.last_price = None
+        self.wal_records = 0
+        self.wal = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def load(self):
+        """加载快照并重放WAL，返回(网格订单列表, 参考价格)"""
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self.orders = {order['id']: order for order in snapshot['orders']}
+            self.last_price = snapshot['last_price']
+
+        valid_size = 0
+        if os.path.exists(self.wal_path):
+            with open(self.wal_path, 'rb') as f:
+                lines = f.readlines()
+            for number, line in enumerate(lines, 1):
+                if not line.endswith(b'\n'):
+                    # 崩溃时写了一半的记录（即使是完整的JSON，缺少换行也会和下一条记录写在同一行），丢弃并截断
+                    logger.warning(f"状态日志{self.wal_path}末尾记录不完整，已丢弃")
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 只有末尾记录可能写了一半，中间的损坏记录不能截断，否则会丢弃其后的有效记录
+                    logger.error(f"状态日志{self.wal_path}第{number}行损坏，需要人工检查")
+                    raise
+                self._apply(record)
+                valid_size += len(line)
+                self.wal_records += 1
+            if valid_size < os.path.getsize(self.wal_path):
+                with open(self.wal_path, 'r+b') as f:
+                    f.truncate(valid_size)
+
+        self.wal = open(self.wal_path, 'ab')
+        return list(self.orders.values()), self.last_price
+
+    def _apply(self, record):
+        op = record['op']
+        if op == 'open':
+            self.orders[record['order']['id']] = record['order']
+        elif op == 'close':
+            self.orders.pop(record['id'], None)
+        elif op == 'price':
+            self.last_price = record['price']
+
+    def _append(self, record):
+        self._apply(record)
+        self.wal.write(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n')
+        self.wal.flush()
+        if self.fsync:
+            os.fsync(self.wal.fileno())
+        self.wal_records += 1
+        if self.wal_records >= self.snapshot_every:
+            self.snapshot()
+
+    def record_open(self, order):
+        """记录新开的网格订单，order中只保留可序列化的字段"""
+        self._append({'op': 'open', 'order': order})
+
+    def record_close(self, order_id):
+        """记录已平仓的网格订单"""
+        self._append({'op': 'close', 'id': order_id})
+
+    def record_last_price(self, price):
+        """记录网格参考价格"""
+        self._append({'op': 'price', 'price': price})
+
+    def snapshot(self):
+        """写入快照并清空WAL"""
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(
+                {'orders': list(self.orders.values()), 'last_price': self.last_price},
+                f,
+                separators=(',', ':')
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        self.wal.close()
+        self.wal = open(self.wal_path, 'wb')
+        self.wal_records = 0
+
+    def close(self):
+        if self.wal is not None:
+            self.wal.close()
+            self.wal = None
@@ -0,0 +1,156 @@
+from loguru import logger
+from profiler import profiler
+from trading_mode import namespaced
+from datetime import datetime, timezone
+import os
+import time
+
+# 汇总粒度（秒）
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+class TimeSeriesStore:
+    """指标时间序列的增量汇总
+
+    每次记录只更新内存中各粒度当前时间桶的开高低收、合计和次数，每flush_interval秒
+    批量写入metric_rollups表。写入使用ON DUPLICATE KEY UPDATE合并，同一时间桶可以
+    多次写入、多个进程同时写入。
+    看板按时间范围选择粒度，只读取几百个预先汇总好的点。
+
+    指标分两类：价格、权益、敞口等取收盘值（close）；已实现盈亏等按事件记录的
+    增量取合计（total），累加后得到累计曲线。
+
+    权益、敞口、浮动盈亏只反映本进程（账户）的状态，多个进程写同一个指标时收盘值会
+    互相覆盖，因此通过record_source记录为'名称:来源'，看板用load_total按来源相加。
+
+    Args:
+        db (Database): 数据库连接
+        flush_interval (float): 写库间隔（秒）
+        minute_retention_days (float): 1分钟粒度数据保留天数，0表示不清理
+        source (str): 进程或账户标识，如'eth_futures'
+    """
+
+    def __init__(self, db, flush_interval=10, minute_retention_days=7, source='default'):
+        self.db = db
+        self.source = source
+        self.flush_interval = flush_interval
+        self.minute_retention_days = minute_retention_days
+        self.pending = {}  # (指标, 粒度, 时间桶) -> [开, 高, 低, 收, 合计, 次数]
+        self.last_flush = time.monotonic()
+        self.last_prune = 0.0
+        self.latest = None  # 最新记录的时间戳（数据时间），回放时与系统时间无关
+
+    def record(self, series, value, timestamp=None):
+        """记录一个指标值
+
+        Args:
+            series (str): 指标名称，如'equity'、'price:ETH/USDT'
+            value (float): 指标值
+            timestamp (float): 秒级时间戳，默认为当前时间，回放时传入数据时间
+        """
+        value = float(value)
+        timestamp = int(timestamp if timestamp is not None else time.time())
+        if self.latest is None or timestamp > self.latest:
+            self.latest = timestamp
+        for resolution, seconds in RESOLUTIONS.items():
+            key = (series, resolution, timestamp - timestamp % seconds)
+            bucket = self.pending.get(key)
+            if bucket is None:
+                self.pending[key] = [value, value, value, value, value, 1]
+            else:
+                if value > bucket[1]:
+                    bucket[1] = value
+                if value < bucket[2]:
+                    bucket[2] = value
+                bucket[3] = value
+                bucket[4] += value
+                bucket[5] += 1
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def record_source(self, series, value, timestamp=None):
+        """记录只属于本进程（账户）的指标，指标名称加上来源标识"""
+        self.record(f"{series}:{self.source}", value, timestamp)
+
+    def flush(self):
+        """将内存中的时间桶写入数据库，失败时保留到下次重试"""
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        rows = [
+            (series, resolution, _to_datetime(bucket), *values)
+            for (series, resolution, bucket), values in self.pending.items()
+        ]
+        try:
+            with profiler.phase('db'):
+                self.db.upsert_metric_rollups(rows)
+        except Exception as e:
+            logger.error(f"写入指标汇总失败：{str(e)}")
+            return
+        self.pending = {}
+
+        # 保留期按最新记录的数据时间计算，回放历史数据时不会把刚写入的1分钟数据删掉
+        if self.minute_retention_days and time.time() - self.last_prune >= 3600:
+            self.last_prune = time.time()
+            before = _to_datetime(self.latest - self.minute_retention_days * 86400)
+            try:
+                with profiler.phase('db'):
+                    self.db.delete_metric_rollups_before('1m', before)
+            except Exception as e:
+                logger.error(f"清理指标汇总失败：{str(e)}")
+
+def _to_datetime(timestamp):
+    """秒级时间戳转换为UTC时间（不带时区，与DATETIME字段对应）"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+def choose_resolution(seconds, max_points=800):
+    """选择点数不超过max_points的最细粒度"""
+    for resolution, period in RESOLUTIONS.items():
+        if seconds / period <= max_points:
+            return resolution
+    return '1d'
+
+def load_series(db, series, days, max_points=800):
+    """读取最近days天的指标汇总，返回以时间桶为索引的DataFrame（open/high/low/close/total/samples）"""
+    import pandas as pd
+    resolution = choose_resolution(days * 86400, max_points)
+    since = _to_datetime(time.time() - days * 86400)
+    rows = db.get_metric_rollups(series, resolution, since=since)
+    columns = ['bucket', 'open', 'high', 'low', 'close', 'total', 'samples']
+    df = pd.DataFrame(rows, columns=columns)
+    for column in columns[1:]:
+        df[column] = df[column].astype(float)
+    return df.set_index('bucket')
+
+def load_total(db, series, days, max_points=800):
+    """读取各来源记录的同名指标（'名称:来源'），按时间桶相加后返回收盘值序列
+
+    某个来源在时间桶内没有记录时沿用它之前的值。
+    """
+    import pandas as pd
+    sources = db.get_metric_series(f"{series}:")
+    if not sources:
+        return pd.Series(dtype=float)
+    closes = pd.concat({name: load_series(db, name, days, max_points)['close'] for name in sources}, axis=1)
+    return closes.sort_index().ffill().sum(axis=1)
+
+# 进程内所有交易实例共享同一个指标存储
+_store = None
+
+def get_timeseries_store(db, source='default'):
+    """获取共享的指标存储，首次调用时按环境变量创建
+
+    Args:
+        db (Database): 数据库连接
+        source (str): 默认的来源标识，可用环境变量METRICS_SOURCE覆盖（同一程序连接多个账户运行时），
+            模拟和回放模式加上模式后缀
+    """
+    global _store
+    if _store is None:
+        db.ensure_metric_rollups()
+        _store = TimeSeriesStore(
+            db,
+            flush_interval=float(os.getenv('METRICS_FLUSH_INTERVAL', 10)),
+            minute_retention_days=float(os.getenv('METRICS_MINUTE_RETENTION_DAYS', 7)),
+            source=namespaced(os.getenv('METRICS_SOURCE') or source)
+        )
+    return _store
@@ -0,0 +1,18 @@
+import os
+
+def get_exchange_mode():
+    """当前交易所模式（环境变量EXCHANGE_MODE）：live、sim或paper，默认live"""
+    return os.getenv('EXCHANGE_MODE', 'live')
+
+def namespaced(name, separator='_'):
+    """按交易所模式区分状态名称
+
+    模拟和回放模式的数据库、状态日志目录和指标来源加上模式后缀（如grid_trading_sim、
+    grid_state/sim），不会读写实盘的持仓、挂单和看板数据；live模式原样返回。
+
+    Args:
+        name (str): 实盘使用的名称
+        separator (str): 名称与模式之间的分隔符，目录使用os.sep
+    """
+    mode = get_exchange_mode()
+    return name if mode == 'live' else f"{name}{separator}{mode}"
@@ -1,6 +1,7 @@
 import streamlit as st
-from eth_grid_trading import ETHGridTrading
 from database import Database
+from timeseries_store import load_series, load_total
+import pandas as pd
 import os
 from dotenv import load_dotenv
 
@@ -10,6 +11,22 @@ load_dotenv()
 # 初始化数据库连接
 db = Database()
 
+def show_line_chart(title, data):
+    """显示折线图，没有数据时显示提示"""
+    st.caption(title)
+    if data.empty:
+        st.info("暂无数据")
+    else:
+        st.line_chart(data)
+
+def metrics_available():
+    """确保指标汇总表存在，表不存在且无法创建（如看板账号只读）时返回False"""
+    try:
+        db.ensure_metric_rollups()
+        return True
+    except Exception:
+        return False
+
 def main():
     st.set_page_config(page_title="ETH网格交易系统", layout="wide")
     st.title("ETH网格交易系统")
@@ -23,6 +40,9 @@ def main():
         profit_target = st.number_input("目标利润点数", value=50.0, step=1.0)
         
         if st.button("更新参数"):
+            # 延迟导入，避免每次页面刷新都加载ccxt和创建交易实例
+            from eth_grid_trading import ETHGridTrading
+            
             # 更新交易参数
             trading_bot = ETHGridTrading()
             trading_bot.long_grid_size = long_grid_size
@@ -40,9 +60,9 @@ def main():
         positions = db.get_open_positions()
         if positions:
             for pos in positions:
-                st.write(f"类型: {'多单' if pos['type'] == 'long' else '空单'}")
-                st.write(f"开仓价格: {pos['entry_price']}")
-                st.write(f"数量: {pos['size']}")
+                st.write(f"类型: {'多单' if pos.side == 'long' else '空单'}")
+                st.write(f"开仓价格: {pos.entry_price}")
+                st.write(f"数量: {pos.quantity}")
                 st.write("---")
         else:
             st.info("当前没有持仓")
@@ -62,6 +82,33 @@ def main():
         else:
             st.info("暂无交易记录")
 
+    # 历史走势，读取交易程序预先汇总的指标（metric_rollups），每个图表只有几百个点
+    st.subheader("历史走势")
+    if not metrics_available():
+        st.info("暂无数据")
+    else:
+        # 12小时以内的范围读取1分钟粒度，更长的范围读取1小时/1天粒度
+        hours = st.selectbox("时间范围", [1, 6, 12, 24, 24 * 7, 24 * 30, 24 * 90, 24 * 365], index=5,
+                             format_func=lambda h: f"最近{h}小时" if h < 24 else f"最近{h // 24}天")
+        days = hours / 24
+        col3, col4 = st.columns(2)
+
+        with col3:
+            show_line_chart("账户权益（USDT）", load_total(db, 'equity', days))
+            show_line_chart("组合敞口（名义价值，USDT）", load_total(db, 'exposure', days))
+
+        with col4:
+            symbols = [series.split(':', 1)[1] for series in db.get_metric_series('price:')]
+            if symbols:
+                symbol = st.selectbox("交易对", symbols)
+                show_line_chart(f"{symbol}价格", load_series(db, f"price:{symbol}", days)['close'])
+                realized = load_series(db, f"realized:{symbol}", days)['total'].cumsum()
+                unrealized = load_total(db, f"unrealized:{symbol}", days)
+                pnl = pd.DataFrame({'区间已实现盈亏': realized, '浮动盈亏': unrealized}).sort_index().ffill().fillna(0)
+                show_line_chart(f"{symbol}盈亏（USDT）", pnl)
+            else:
+                st.info("暂无交易对指标")
+
     # 系统状态
     st.subheader("系统状态")
     st.write("✅ 系统运行中")